@@ -4,6 +4,11 @@ AI Reel Maker API Module
 This module contains the FastAPI application for the AI Reel Maker service.
 """
 
-from .main import app
+from dotenv import load_dotenv
+
+# Load environment variables from .env file once, before any service reads them
+load_dotenv()
+
+from .main import app  # noqa: E402
 
 __all__ = ["app"]
@@ -0,0 +1,104 @@
+"""
+Background jobs for long-running Replicate work.
+
+Slow endpoints push their request onto a Redis list through a FastStream
+broker and return a job id immediately. Workers running inside each API process
+pop from the list, so every job runs exactly once however many processes there
+are, and jobs queued while no worker is connected wait on the list. Outcomes
+are recorded in Redis for GET /jobs/{job_id}.
+"""
+
+import contextlib
+import logging
+import os
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from faststream.exceptions import IncorrectState
+from faststream.redis import ListSub, RedisBroker
+from redis.exceptions import RedisError
+
+from .services import _cache as job_store
+from .services import (
+    AddSoundEffectService,
+    CombineImageService,
+    GenerateVideoService,
+    ServiceError,
+)
+
+logger = logging.getLogger(__name__)
+
+broker = RedisBroker(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Raised by publish when Redis is down or the broker never connected at startup
+_QUEUE_ERRORS = (RedisError, OSError, IncorrectState)
+
+# Job records only point at Replicate outputs, so they expire with them
+JOB_TTL = job_store.REPLICATE_CACHE_TTL
+
+
+def _job_key(job_id: str) -> str:
+    return f"reel:job:{job_id}"
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Return the stored record for job_id, or None if it is unknown or expired."""
+    return await job_store.get(_job_key(job_id))
+
+
+def _queue(name: str) -> str:
+    return f"reel:queue:{name}"
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Any) -> AsyncIterator[None]:
+    """Run the job workers for the app's lifetime; without Redis the rest of the API still starts."""
+    try:
+        # Ping first: started subscribers would otherwise retry a dead Redis in a busy loop
+        await (await broker.connect()).ping()
+        await broker.start()
+    except (RedisError, OSError):
+        logger.warning("Job queue unavailable, /jobs endpoints will answer 503", exc_info=True)
+        await broker.stop()
+    try:
+        yield
+    finally:
+        await broker.stop()
+
+
+async def enqueue(queue: str, request: Dict[str, Any]) -> str:
+    """Push request onto queue and return the new job id."""
+    job_id = uuid.uuid4().hex
+    await job_store.put(_job_key(job_id), {"state": "queued"}, JOB_TTL)
+    try:
+        await broker.publish({"job_id": job_id, "request": request}, list=_queue(queue))
+    except _QUEUE_ERRORS as e:
+        raise ServiceError(503, f"Job queue unavailable: {str(e)}")
+    return job_id
+
+
+async def _run(message: Dict[str, Any], service: Callable[..., Awaitable[Dict]]) -> None:
+    job_id = message["job_id"]
+    await job_store.put(_job_key(job_id), {"state": "running"}, JOB_TTL)
+    try:
+        result = await service(**message["request"])
+    except Exception as e:  # Record the failure so pollers don't wait on a dead job
+        result = {"status": "error", "message": f"Job failed: {str(e)}"}
+    await job_store.put(
+        _job_key(job_id), {"state": "finished", "result": result}, JOB_TTL
+    )
+
+
+@broker.subscriber(list=ListSub(_queue("generate_video")))
+async def generate_video_worker(message: Dict[str, Any]) -> None:
+    await _run(message, GenerateVideoService.generate_video)
+
+
+@broker.subscriber(list=ListSub(_queue("combine_image")))
+async def combine_image_worker(message: Dict[str, Any]) -> None:
+    await _run(message, CombineImageService.combine_image)
+
+
+@broker.subscriber(list=ListSub(_queue("add_sound_effect")))
+async def add_sound_effect_worker(message: Dict[str, Any]) -> None:
+    await _run(message, AddSoundEffectService.add_sound_effect)
@@ -1,4 +1,12 @@
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import json
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, Tuple
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from replicate.exceptions import ModelError, ReplicateError
 from .schemas import (
     StoryboardRequest,
     VideoPromptRequest,
@@ -9,10 +17,23 @@ from .schemas import (
     CombinePromptRequest,
     CombineImageRequest,
     GenerateVideoRequest,
+    GenerateVideosRequest,
     ExtractFrameRequest,
     MergeVideosRequest,
+    MergeVideoItem,
     AddSoundEffectRequest,
+    SceneAssetsRequest,
+    SceneImagesRequest,
+    ScenePromptsRequest,
+    ImageResponse,
+    VideoResponse,
+    SceneImagesResponse,
+    SceneAssetsResponse,
+    ScenePromptsResponse,
+    MAX_BATCH_ITEMS,
 )
+from pydantic import BaseModel, ValidationError
+from . import jobs
 from .services import (
     StoryboardService,
     VideoPromptService,
@@ -26,76 +47,394 @@ from .services import (
     ExtractFrameService,
     MergeVideosService,
     AddSoundEffectService,
+    ServiceError,
 )
+from .services._cache import REPLICATE_CACHE_TTL
 
-app = FastAPI(title="AI Reel Maker API")
+app = FastAPI(
+    title="AI Reel Maker API", default_response_class=ORJSONResponse, lifespan=jobs.lifespan
+)
+
+# Caps how many /scene-images and /scene-assets fan-outs hit Replicate at once to avoid rate-limit storms
+SCENE_ASSETS_SEMAPHORE = asyncio.Semaphore(int(os.getenv("SCENE_ASSETS_CONCURRENCY", "4")))
+
+# Caps how many Seedance jobs /generate-videos keeps in flight, to stay inside account limits
+VIDEO_BATCH_SEMAPHORE = asyncio.Semaphore(int(os.getenv("VIDEO_BATCH_CONCURRENCY", "8")))
+
+
+# Everything the handlers below turn into an error response
+_HANDLED_ERRORS = (ServiceError, ReplicateError, ModelError, httpx.HTTPError)
+
+
+def _error_content(exc: Exception) -> Dict:
+    """The {"status": "error", ...} body for one of _HANDLED_ERRORS."""
+    if isinstance(exc, ServiceError):
+        content = {"status": "error", "message": exc.message}
+        if exc.raw_output is not None:
+            content["raw_output"] = exc.raw_output
+        return content
+    if isinstance(exc, httpx.HTTPError):
+        # Timeouts and connection failures talking to Replicate never reach a status
+        # code, so ReplicateError doesn't cover them
+        return {
+            "status": "error",
+            "message": f"Upstream request failed: {str(exc) or type(exc).__name__}",
+        }
+    return {"status": "error", "message": f"Replicate request failed: {str(exc)}"}
+
+
+# Services raise instead of returning error dicts; these keep the same error body
+# but give clients and proxies a real status code
+@app.exception_handler(ServiceError)
+async def service_error_handler(request: Request, exc: ServiceError):
+    return ORJSONResponse(_error_content(exc), status_code=exc.status)
+
+
+@app.exception_handler(ReplicateError)
+@app.exception_handler(ModelError)
+@app.exception_handler(httpx.HTTPError)
+async def upstream_error_handler(request: Request, exc: Exception):
+    # Upstream API or prediction failure, so the gateway is what went wrong
+    return ORJSONResponse(_error_content(exc), status_code=502)
+
+
+# Media endpoints are pure functions of their body, so clients and intermediaries
+# can revalidate by ETag. max-age matches how long Replicate keeps the output.
+MEDIA_CACHE_CONTROL = f"public, max-age={REPLICATE_CACHE_TTL}"
+
+
+def _etag(body: BaseModel) -> str:
+    canonical = json.dumps(body.model_dump(mode="json"), sort_keys=True)
+    return '"' + hashlib.sha256(canonical.encode("utf-8")).hexdigest() + '"'
+
+
+async def _conditional(
+    http_request: Request,
+    response: Response,
+    body: BaseModel,
+    nocache: bool,
+    produce: Callable[[], Awaitable[Dict]],
+):
+    """Answer 304 when the client already holds the result for this body, else run produce."""
+    etag = _etag(body)
+    if not nocache and http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Failures raise, so reaching here means there is a result worth caching
+    result = await produce()
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = MEDIA_CACHE_CONTROL
+    return result
 
 
 # Endpoints
 @app.get("/")
-def root():
+async def root():
     return {"message": "AI Reel Maker API", "status": "running"}
 
 
 @app.post("/storyboard")
-def create_storyboard(request: StoryboardRequest):
-    return StoryboardService.create_storyboard(request.idea)
+async def create_storyboard(request: StoryboardRequest):
+    return await StoryboardService.create_storyboard(request.idea)
 
 
 @app.post("/character-prompt")
-def create_character_prompt(request: CharacterPromptRequest):
-    return CharacterPromptService.create_character_prompt(
+async def create_character_prompt(request: CharacterPromptRequest):
+    return await CharacterPromptService.create_character_prompt(
         request.description, request.name
     )
 
 
-@app.post("/character-image")
-def create_character_image(request: CharacterImageRequest):
-    return CharacterImageService.create_character_image(request.prompt)
+@app.post("/character-image", response_model=ImageResponse)
+async def create_character_image(
+    request: CharacterImageRequest,
+    http_request: Request,
+    response: Response,
+    nocache: bool = False,
+):
+    return await _conditional(
+        http_request,
+        response,
+        request,
+        nocache,
+        lambda: CharacterImageService.create_character_image(
+            request.prompt, nocache=nocache
+        ),
+    )
 
 
 @app.post("/setting-prompt")
-def create_setting_prompt(request: SettingPromptRequest):
-    return SettingPromptService.create_setting_prompt(request.description)
+async def create_setting_prompt(request: SettingPromptRequest):
+    return await SettingPromptService.create_setting_prompt(request.description)
 
 
-@app.post("/setting-image")
-def create_setting_image(request: SettingImageRequest):
-    return SettingImageService.create_setting_image(request.prompt)
+@app.post("/setting-image", response_model=ImageResponse)
+async def create_setting_image(
+    request: SettingImageRequest,
+    http_request: Request,
+    response: Response,
+    nocache: bool = False,
+):
+    return await _conditional(
+        http_request,
+        response,
+        request,
+        nocache,
+        lambda: SettingImageService.create_setting_image(
+            request.prompt, nocache=nocache
+        ),
+    )
 
 
 @app.post("/combine-prompt")
-def combine_prompt(request: CombinePromptRequest):
-    return CombinePromptService.combine_prompt(request.scene_description)
+async def combine_prompt(request: CombinePromptRequest):
+    return await CombinePromptService.combine_prompt(request.scene_description)
+
+
+@app.post("/combine-prompt/stream")
+async def stream_combine_prompt(request: CombinePromptRequest):
+    # Server-sent events: raw prompt text as Gemini decodes it, then the final result
+    async def events():
+        try:
+            async for event, data in CombinePromptService.stream_combine_prompt(
+                request.scene_description
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except _HANDLED_ERRORS as e:
+            # The 200 is already sent, so a failure can only arrive as the result event
+            yield f"event: result\ndata: {json.dumps(_error_content(e))}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
-@app.post("/combine-image")
-def combine_image(request: CombineImageRequest):
-    return CombineImageService.combine_image(
-        request.prompt, request.character_image, request.setting_image
+@app.post("/combine-image", response_model=ImageResponse)
+async def combine_image(
+    request: CombineImageRequest,
+    http_request: Request,
+    response: Response,
+    nocache: bool = False,
+):
+    return await _conditional(
+        http_request,
+        response,
+        request,
+        nocache,
+        lambda: CombineImageService.combine_image(
+            request.prompt,
+            str(request.character_image),
+            str(request.setting_image),
+            nocache=nocache,
+        ),
     )
 
 
+async def _scene_images(character_prompt: str, setting_prompt: str, nocache: bool):
+    # Character and setting images have no data dependency, so generate them in parallel.
+    # Minimax takes a single prompt and aspect ratio per job, so one
+    # number_of_images=2 call cannot produce both images.
+    return await asyncio.gather(
+        CharacterImageService.create_character_image(character_prompt, nocache=nocache),
+        SettingImageService.create_setting_image(setting_prompt, nocache=nocache),
+    )
+
+
+@app.post("/scene-images", response_model=SceneImagesResponse)
+async def create_scene_images(request: SceneImagesRequest, nocache: bool = False):
+    async with SCENE_ASSETS_SEMAPHORE:
+        character, setting = await _scene_images(
+            request.character_prompt, request.setting_prompt, nocache
+        )
+
+    return {
+        "status": "success",
+        "message": "Scene images created successfully",
+        "character_image": character["image_url"],
+        "setting_image": setting["image_url"],
+    }
+
+
+@app.post("/scene-assets", response_model=SceneAssetsResponse)
+async def create_scene_assets(request: SceneAssetsRequest, nocache: bool = False):
+    async with SCENE_ASSETS_SEMAPHORE:
+        character, setting = await _scene_images(
+            request.character_prompt, request.setting_prompt, nocache
+        )
+        combined = await CombineImageService.combine_image(
+            request.combine_prompt,
+            character["image_url"],
+            setting["image_url"],
+            nocache=nocache,
+        )
+
+    return {
+        "status": "success",
+        "message": "Scene assets created successfully",
+        "character_image": character["image_url"],
+        "setting_image": setting["image_url"],
+        "image_url": combined["image_url"],
+    }
+
+
+@app.post("/scene-prompts", response_model=ScenePromptsResponse)
+async def create_scene_prompts(request: ScenePromptsRequest):
+    # Combination prompts for all scenes share one Gemini call; video prompts are
+    # independent calls run alongside it, so the batch takes as long as the slowest
+    scenes = request.scene_descriptions
+    combine_results, *video_results = await asyncio.gather(
+        CombinePromptService.combine_prompts_batch(scenes),
+        *[VideoPromptService.create_video_prompt(scene) for scene in scenes],
+    )
+
+    return {
+        "status": "success",
+        "message": "Scene prompts created successfully",
+        "combine_prompts": [result["prompt"] for result in combine_results],
+        "video_prompts": [result["prompt"] for result in video_results],
+    }
+
+
 @app.post("/extract-frame")
-def extract_frame(request: ExtractFrameRequest):
-    return ExtractFrameService.extract_frame(request.video_url)
+async def extract_frame(request: ExtractFrameRequest, nocache: bool = False):
+    return await ExtractFrameService.extract_frame(str(request.video_url), nocache=nocache)
 
 
 @app.post("/video-prompt")
-def create_video_prompt(request: VideoPromptRequest):
-    return VideoPromptService.create_video_prompt(request.scene_description)
+async def create_video_prompt(request: VideoPromptRequest):
+    return await VideoPromptService.create_video_prompt(request.scene_description)
 
 
 @app.post("/generate-video")
-def generate_video(request: GenerateVideoRequest):
-    return GenerateVideoService.generate_video(request.prompt, request.initial_image)
+async def generate_video(request: GenerateVideoRequest, nocache: bool = False):
+    return await GenerateVideoService.generate_video(
+        request.prompt, str(request.initial_image), nocache=nocache
+    )
+
+
+@app.post("/generate-videos")
+async def generate_videos(request: GenerateVideosRequest):
+    # Independent scenes render at the same time, so the batch takes about as long
+    # as one video instead of one per scene
+    async def generate(video: GenerateVideoRequest):
+        async with VIDEO_BATCH_SEMAPHORE:
+            try:
+                return await GenerateVideoService.generate_video(
+                    video.prompt, str(video.initial_image)
+                )
+            except _HANDLED_ERRORS as e:
+                return _error_content(e)
+
+    results = await asyncio.gather(*[generate(video) for video in request.videos])
+
+    # Keep every result: one failed scene shouldn't throw away the finished ones
+    failed = sum(result["status"] != "success" for result in results)
+    return {
+        "status": "success" if not failed else "error",
+        "message": (
+            f"Generated {len(results)} videos"
+            if not failed
+            else f"{failed} of {len(results)} videos failed"
+        ),
+        "results": results,
+    }
+
+
+@app.post("/generate-video/stream")
+async def stream_generate_video(request: GenerateVideoRequest):
+    # Server-sent events: progress frames while the job runs, then the final result
+    async def events():
+        try:
+            async for event, data in GenerateVideoService.stream_video(
+                request.prompt, str(request.initial_image)
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except _HANDLED_ERRORS as e:
+            # The 200 is already sent, so a failure can only arrive as the result event
+            yield f"event: result\ndata: {json.dumps(_error_content(e))}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 @app.post("/merge-videos")
-def merge_videos(request: MergeVideosRequest):
-    return MergeVideosService.merge_videos(request.video_urls)
+async def merge_videos(request: MergeVideosRequest):
+    return await MergeVideosService.merge_videos([str(url) for url in request.video_urls])
+
+
+async def _ndjson_videos(http_request: Request) -> AsyncIterator[Tuple[int, str]]:
+    # One MergeVideoItem per line; lines are handed on as soon as they are complete,
+    # without waiting for the rest of the (chunked) request body
+    count = 0
+
+    def parse(line: bytes) -> Tuple[int, str]:
+        nonlocal count
+        # Same cap as the batch schemas; each item starts a download
+        count += 1
+        if count > MAX_BATCH_ITEMS:
+            raise ServiceError(422, f"At most {MAX_BATCH_ITEMS} videos can be merged")
+        try:
+            item = MergeVideoItem.model_validate_json(line)
+        except ValidationError as e:
+            # A bad line is the client's mistake, like a bad body on /merge-videos
+            raise ServiceError(422, f"Invalid video item {count}: {str(e)}")
+        return item.index, str(item.video_url)
+
+    buffer = b""
+    async for chunk in http_request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield parse(line)
+    if buffer.strip():
+        yield parse(buffer)
+
+
+@app.post("/merge-videos/stream")
+async def merge_video_stream(http_request: Request):
+    # Downloads start while the client is still sending later videos
+    return await MergeVideosService.merge_video_stream(_ndjson_videos(http_request))
+
+
+@app.post("/add-sound-effect", response_model=VideoResponse)
+async def add_sound_effect(
+    request: AddSoundEffectRequest,
+    http_request: Request,
+    response: Response,
+    nocache: bool = False,
+):
+    return await _conditional(
+        http_request,
+        response,
+        request,
+        nocache,
+        lambda: AddSoundEffectService.add_sound_effect(
+            str(request.video_url), request.sound_effect, nocache=nocache
+        ),
+    )
+
+
+# Queued variants of the slow endpoints: return a job id now, poll /jobs/{job_id}
+# (mode="json" so URL fields are published as plain strings)
+@app.post("/jobs/generate-video")
+async def enqueue_generate_video(request: GenerateVideoRequest):
+    job_id = await jobs.enqueue("generate_video", request.model_dump(mode="json"))
+    return {"status": "success", "message": "Video generation queued", "job_id": job_id}
+
+
+@app.post("/jobs/combine-image")
+async def enqueue_combine_image(request: CombineImageRequest):
+    job_id = await jobs.enqueue("combine_image", request.model_dump(mode="json"))
+    return {"status": "success", "message": "Image combination queued", "job_id": job_id}
+
+
+@app.post("/jobs/add-sound-effect")
+async def enqueue_add_sound_effect(request: AddSoundEffectRequest):
+    job_id = await jobs.enqueue("add_sound_effect", request.model_dump(mode="json"))
+    return {"status": "success", "message": "Sound effect job queued", "job_id": job_id}
 
 
-@app.post("/add-sound-effect")
-def add_sound_effect(request: AddSoundEffectRequest):
-    return AddSoundEffectService.add_sound_effect(request.video_url, request.sound_effect)
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise ServiceError(404, "Job not found or expired")
+    return {"status": "success", "message": f"Job {job['state']}", "job_id": job_id, **job}
@@ -0,0 +1,183 @@
+"""
+Schemas for AI Reel Maker API
+
+Pydantic models for request/response validation.
+"""
+
+from typing import Annotated, List
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
+
+# Generated prompts run to a few hundred words, so leave generous headroom
+# (URL fields use HttpUrl, which carries its own length limit)
+PROMPT_MAX_LENGTH = 4000
+
+# A storyboard has 12 scenes; batch requests allow double that so one request
+# can't fan out unbounded
+MAX_BATCH_ITEMS = 24
+
+
+class RequestModel(BaseModel):
+    """Immutable request body that rejects unknown fields and strips surrounding whitespace."""
+
+    model_config = ConfigDict(frozen=True, extra="forbid", str_strip_whitespace=True)
+
+
+# Requests
+class StoryboardRequest(RequestModel):
+    """Request model for storyboard creation."""
+    idea: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class VideoPromptRequest(RequestModel):
+    """Request model for video prompt creation."""
+    scene_description: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class CharacterPromptRequest(RequestModel):
+    """Request model for character prompt creation."""
+    description: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+    name: str = Field(min_length=1, max_length=100)
+
+
+class SettingPromptRequest(RequestModel):
+    """Request model for setting prompt creation."""
+    description: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class CharacterImageRequest(RequestModel):
+    """Request model for character image creation."""
+    prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class SettingImageRequest(RequestModel):
+    """Request model for setting image creation."""
+    prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class CombinePromptRequest(RequestModel):
+    """Request model for prompt combination."""
+    scene_description: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class CombineImageRequest(RequestModel):
+    """Request model for image combination."""
+    prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+    character_image: HttpUrl
+    setting_image: HttpUrl
+
+
+class GenerateVideoRequest(RequestModel):
+    """Request model for video generation."""
+    prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+    initial_image: HttpUrl
+
+
+class GenerateVideosRequest(RequestModel):
+    """Request model for generating several independent videos in one call."""
+    # A storyboard has 12 scenes; the cap keeps one request from fanning out unbounded
+    videos: List[GenerateVideoRequest] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+class ExtractFrameRequest(RequestModel):
+    """Request model for frame extraction."""
+    video_url: HttpUrl
+
+
+class MergeVideosRequest(RequestModel):
+    """Request model for merging multiple videos."""
+    video_urls: List[HttpUrl] = Field(min_length=2, max_length=MAX_BATCH_ITEMS)
+
+
+class MergeVideoItem(RequestModel):
+    """One line of a streamed merge request: a video and its position in the result."""
+    index: int = Field(ge=0, lt=MAX_BATCH_ITEMS)
+    video_url: HttpUrl
+
+
+class AddSoundEffectRequest(RequestModel):
+    """Request model for adding sound effects to video."""
+    video_url: HttpUrl
+    # Free-form on purpose: the storyboard picks any one-word sound, not a fixed list
+    sound_effect: str = Field(default="ambient", min_length=1, max_length=50)
+
+
+class SceneImagesRequest(RequestModel):
+    """Request model for generating character and setting images in one call."""
+    character_prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+    setting_prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class SceneAssetsRequest(RequestModel):
+    """Request model for generating character, setting and combined images in one call."""
+    character_prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+    setting_prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+    combine_prompt: str = Field(min_length=1, max_length=PROMPT_MAX_LENGTH)
+
+
+class ScenePromptsRequest(RequestModel):
+    """Request model for generating combination and video prompts for many scenes at once."""
+    scene_descriptions: List[
+        Annotated[str, Field(min_length=1, max_length=PROMPT_MAX_LENGTH)]
+    ] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+# Responses
+class ImageResponse(BaseModel):
+    """Response model for endpoints that generate a single image."""
+    status: str
+    message: str
+    image_url: str
+
+
+class VideoResponse(BaseModel):
+    """Response model for endpoints that return a processed video."""
+    status: str
+    message: str
+    video_url: str
+
+
+class SceneImagesResponse(BaseModel):
+    """Response model for the character and setting images of a scene."""
+    status: str
+    message: str
+    character_image: str
+    setting_image: str
+
+
+class SceneAssetsResponse(SceneImagesResponse):
+    """Response model for a scene's images plus the combined image."""
+    image_url: str
+
+
+class ScenePromptsResponse(BaseModel):
+    """Response model for per-scene prompts, in the same order as the request."""
+    status: str
+    message: str
+    combine_prompts: List[str]
+    video_prompts: List[str]
+
+
+__all__ = [
+    "StoryboardRequest",
+    "VideoPromptRequest",
+    "CharacterPromptRequest",
+    "SettingPromptRequest",
+    "CharacterImageRequest",
+    "SettingImageRequest",
+    "CombinePromptRequest",
+    "CombineImageRequest",
+    "GenerateVideoRequest",
+    "GenerateVideosRequest",
+    "ExtractFrameRequest",
+    "MergeVideosRequest",
+    "MergeVideoItem",
+    "AddSoundEffectRequest",
+    "SceneAssetsRequest",
+    "SceneImagesRequest",
+    "ScenePromptsRequest",
+    "ImageResponse",
+    "VideoResponse",
+    "SceneImagesResponse",
+    "SceneAssetsResponse",
+    "ScenePromptsResponse",
+]
@@ -1,5 +0,0 @@
-from pydantic import BaseModel
-
-
-class ExtractFrameRequest(BaseModel):
-    video_url: str
@@ -16,6 +16,7 @@ from .generate_video_service import GenerateVideoService
 from .extract_frame_service import ExtractFrameService
 from .merge_videos_service import MergeVideosService
 from .add_sound_effect_service import AddSoundEffectService
+from .errors import ServiceError
 
 __all__ = [
     "StoryboardService",
@@ -30,4 +31,5 @@ __all__ = [
     "ExtractFrameService",
     "MergeVideosService",
     "AddSoundEffectService",
+    "ServiceError",
 ]
@@ -0,0 +1,93 @@
+"""
+Shared Redis cache for generated content.
+
+Entries are stored as JSON under namespaced SHA-256 keys. Any Redis failure is
+treated as a cache miss so an unavailable cache never breaks a request.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+_redis = redis.from_url(
+    os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True
+)
+
+# Replicate deletes API prediction outputs after about an hour, so cached media
+# URLs must not outlive them
+REPLICATE_CACHE_TTL = int(os.getenv("REPLICATE_CACHE_TTL", "3600"))
+
+# Generated prompt text never goes stale, but expire it eventually so the cache
+# stays bounded without relying on a Redis eviction policy
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def make_key(namespace: str, *parts: str) -> str:
+    """Build a stable cache key from a namespace and the values that identify an entry."""
+    digest = hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    return f"reel:{namespace}:{digest}"
+
+
+async def get(key: str) -> Optional[Any]:
+    """Return the cached value for key, or None on a miss."""
+    try:
+        value = await _redis.get(key)
+    except RedisError:
+        return None
+    return json.loads(value) if value is not None else None
+
+
+async def put(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    """Store value under key, optionally expiring after ttl seconds."""
+    try:
+        await _redis.set(key, json.dumps(value), ex=ttl)
+    except RedisError:
+        pass
+
+
+def cached_replicate(
+    model: str, build_input: Callable[..., Dict[str, Any]], ttl: int = REPLICATE_CACHE_TTL
+) -> Callable:
+    """
+    Cache a service's successful result keyed on the model and the exact Replicate input.
+
+    build_input takes the decorated coroutine's arguments and returns the input
+    dict the service sends, so fixed parameters such as aspect_ratio are part of
+    the key; the service's qualified name is too, since the cached result carries
+    its message. The decorated coroutine gains a ``nocache`` keyword that skips the
+    lookup and forces a fresh Replicate run (the new result is still stored).
+    """
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, nocache: bool = False, **kwargs: Any) -> Any:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = make_key(
+                "replicate",
+                model,
+                func.__qualname__,
+                json.dumps(build_input(**bound.arguments), sort_keys=True),
+            )
+
+            if not nocache:
+                cached = await get(key)
+                if cached is not None:
+                    return cached
+
+            result = await func(*args, **kwargs)
+            if result.get("status") == "success":
+                await put(key, result, ttl)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,31 @@
+"""
+Helpers for normalizing Replicate model outputs.
+"""
+
+import re
+from typing import Any
+
+# An opening ``` / ```json fence at the very start or a closing ``` at the very
+# end; backticks inside the text are left alone
+_FENCE_RE = re.compile(r"\A\s*```(?:json)?\s*|\s*```\s*\Z")
+
+
+def extract_url(output: Any) -> str:
+    """
+    Return the URL of a Replicate file output.
+
+    Handles a single FileOutput, a list of them (the first item is used), and
+    plain strings. Older clients expose ``url`` as a method, newer ones as an
+    attribute.
+    """
+    if isinstance(output, list) and output:
+        output = output[0]
+    url = getattr(output, "url", None)
+    if isinstance(url, str):
+        return url
+    return url() if callable(url) else str(output)
+
+
+def strip_fence(text: str) -> str:
+    """Remove the outer markdown code fence a model may wrap its answer in, in one pass."""
+    return _FENCE_RE.sub("", text).strip()
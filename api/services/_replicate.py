@@ -0,0 +1,142 @@
+"""
+Shared Replicate client.
+
+One client is built at import and reused by every service, so calls share a
+pooled HTTP/2 connection instead of paying a TCP+TLS handshake each time.
+run(), stream() and create_prediction() additionally bound concurrency per model and
+back off on 429s; services go through them rather than the client directly.
+"""
+
+import asyncio
+import contextlib
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Tuple, TypeVar
+
+import httpx
+import replicate
+from replicate.exceptions import ReplicateError
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+# Resolved once at import: a missing token fails at startup, not on the first request
+_REPLICATE_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+if not _REPLICATE_TOKEN:
+    raise RuntimeError("REPLICATE_API_TOKEN is not set; add it to the environment or .env")
+
+client = replicate.Client(
+    api_token=_REPLICATE_TOKEN,
+    transport=httpx.AsyncHTTPTransport(
+        retries=2,
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    ),
+)
+
+# In-flight predictions allowed per model (keyed without the version hash).
+# Anything past the limit waits locally instead of tripping Replicate's 429s.
+MODEL_CONCURRENCY = {
+    "minimax/image-01": 16,
+    "flux-kontext-apps/multi-image-kontext-pro": 8,
+    "zsxkib/mmaudio": 4,
+}
+DEFAULT_CONCURRENCY = 8
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _semaphore(model: str) -> asyncio.Semaphore:
+    name = model.split(":", 1)[0]
+    if name not in _semaphores:
+        _semaphores[name] = asyncio.Semaphore(MODEL_CONCURRENCY.get(name, DEFAULT_CONCURRENCY))
+    return _semaphores[name]
+
+
+def _is_rate_limited(exc: BaseException) -> bool:
+    return isinstance(exc, ReplicateError) and exc.status == 429
+
+
+def _backoff() -> AsyncRetrying:
+    return AsyncRetrying(
+        retry=retry_if_exception(_is_rate_limited),
+        wait=wait_exponential(multiplier=1, max=30),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+
+
+T = TypeVar("T")
+
+
+async def _start(model: str, create: Callable[[], Awaitable[T]]) -> T:
+    """Take one of model's slots and call create, backing off on 429; the caller releases the slot."""
+    semaphore = _semaphore(model)
+    async for attempt in _backoff():
+        with attempt:
+            # The slot is given back while waiting out a 429
+            await semaphore.acquire()
+            try:
+                return await create()
+            except BaseException:
+                semaphore.release()
+                raise
+
+
+async def run(model: str, input: Dict[str, Any]) -> Any:
+    """client.async_run with a per-model concurrency cap and exponential backoff on 429."""
+    async for attempt in _backoff():
+        with attempt:
+            async with _semaphore(model):
+                return await client.async_run(model, input=input)
+
+
+# Marks a stream that ended before yielding anything
+_EMPTY = object()
+
+
+async def stream(model: str, input: Dict[str, Any]) -> AsyncIterator[Any]:
+    """
+    client.async_stream under the same cap and backoff as run().
+
+    The slot is taken on first iteration and held until the stream is exhausted
+    or closed, since the prediction is in flight for that whole time.
+    """
+
+    async def open_stream() -> Tuple[AsyncIterator[Any], Any]:
+        output = await client.async_stream(model, input=input)
+        # The client only creates the prediction when the stream is first read, so
+        # pull the first item here, where a 429 can still be retried
+        try:
+            first = await output.__anext__()
+        except StopAsyncIteration:
+            first = _EMPTY
+        return output, first
+
+    output, first = await _start(model, open_stream)
+    try:
+        if first is not _EMPTY:
+            yield first
+        async for item in output:
+            yield item
+    finally:
+        try:
+            aclose = getattr(output, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            _semaphore(model).release()
+
+
+@contextlib.asynccontextmanager
+async def create_prediction(model: str, input: Dict[str, Any]) -> AsyncIterator[Any]:
+    """Create a prediction under the same cap and backoff as run(), holding its slot for the block."""
+    created = await _start(
+        model, lambda: client.models.predictions.async_create(model=model, input=input)
+    )
+    try:
+        yield created
+    finally:
+        _semaphore(model).release()
@@ -0,0 +1,179 @@
+"""
+Semantic cache for generated prompts.
+
+Inputs are embedded with a small local sentence-transformers model and matched
+against previously seen inputs with a FAISS inner-product index. Vectors are
+L2-normalized, so the inner product is the cosine similarity.
+
+Set SEMANTIC_CACHE_DIR to persist each namespace's index across restarts (a
+FAISS index file plus a JSON list of entries); otherwise the cache lives in
+process memory only. Each namespace keeps at most SEMANTIC_CACHE_MAX_ENTRIES
+entries, dropping the oldest first.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR")
+
+# A flat index is searched exhaustively, so its size bounds both memory and lookup time
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+# Evicting shifts every remaining vector, so make room for many inserts at once
+_EVICT_TO = 0.9
+
+
+@lru_cache(maxsize=1)
+def _encoder() -> "SentenceTransformer":
+    # Imported and loaded on first use so importing the API stays fast and doesn't
+    # pull in torch; a missing package then only fails (and misses) the lookup
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+def _embed(text: str) -> np.ndarray:
+    return _encoder().encode([text], normalize_embeddings=True).astype("float32")
+
+
+def _write_atomic(path: str, write) -> None:
+    # Write then rename so a concurrent reader never sees a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class SemanticCache:
+    """Nearest-neighbour cache mapping input text to a stored entry."""
+
+    def __init__(self, namespace: str, threshold: float):
+        self.namespace = namespace
+        self.threshold = threshold
+        self._index: Optional[faiss.IndexFlatIP] = None
+        self._entries: List[Dict[str, Any]] = []
+        # Guards loading, mutation and snapshotting of _index and _entries
+        self._lock = asyncio.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+        self._dirty = False
+        if SEMANTIC_CACHE_DIR:
+            base = os.path.join(SEMANTIC_CACHE_DIR, namespace)
+            self._index_path: Optional[str] = f"{base}.faiss"
+            self._entries_path: Optional[str] = f"{base}.json"
+        else:
+            self._index_path = self._entries_path = None
+        self._loaded = self._index_path is None
+
+    def _load(self) -> None:
+        try:
+            index = faiss.read_index(self._index_path)
+            with open(self._entries_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.exception("Could not load semantic cache %s", self._index_path)
+            return
+        if index.ntotal != len(entries):  # Saved by a process that died between the two files
+            logger.warning("Discarding inconsistent semantic cache %s", self._index_path)
+            return
+        self._index = index
+        self._entries = entries
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await asyncio.to_thread(self._load)
+                self._loaded = True
+
+    @staticmethod
+    def _write(
+        index: faiss.Index, entries: List[Dict[str, Any]], index_path: str, entries_path: str
+    ) -> None:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        _write_atomic(index_path, lambda path: faiss.write_index(index, path))
+
+        def dump(path: str) -> None:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+
+        _write_atomic(entries_path, dump)
+
+    async def _save_pending(self) -> None:
+        # One writer per cache; inserts that land while it writes are picked up by
+        # the next pass, so a burst of inserts costs one or two writes, not one each
+        while self._dirty:
+            self._dirty = False
+            async with self._lock:
+                # Copy on the event loop, where every mutation happens, so the
+                # worker thread serializes a consistent snapshot
+                index = faiss.clone_index(self._index)
+                entries = list(self._entries)
+            try:
+                await asyncio.to_thread(
+                    self._write, index, entries, self._index_path, self._entries_path
+                )
+            except Exception:
+                logger.exception("Could not persist semantic cache %s", self._index_path)
+
+    async def nearest(self, text: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Return (similarity, entry) for the most similar stored text, whatever the score."""
+        await self._ensure_loaded()
+        if not self._entries:
+            return None
+        try:
+            embedding = await asyncio.to_thread(_embed, text)
+        except Exception:
+            logger.exception("Semantic cache lookup failed for %s", self.namespace)
+            return None
+
+        similarities, ids = self._index.search(embedding, 1)
+        return float(similarities[0][0]), self._entries[ids[0][0]]
+
+    async def lookup(self, text: str) -> Optional[Dict[str, Any]]:
+        """Return the entry stored for the most similar text, if it clears the threshold."""
+        match = await self.nearest(text)
+        if match is None or match[0] < self.threshold:
+            return None
+        return match[1]
+
+    async def add(self, text: str, entry: Dict[str, Any]) -> None:
+        """Index text and remember the entry generated for it."""
+        await self._ensure_loaded()
+        try:
+            embedding = await asyncio.to_thread(_embed, text)
+        except Exception:
+            logger.exception("Semantic cache insert failed for %s", self.namespace)
+            return
+
+        async with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(embedding.shape[1])
+            self._index.add(embedding)
+            self._entries.append(entry)
+
+            # Drop the oldest entries once the cap is passed
+            if len(self._entries) > SEMANTIC_CACHE_MAX_ENTRIES:
+                excess = len(self._entries) - int(SEMANTIC_CACHE_MAX_ENTRIES * _EVICT_TO)
+                self._index.remove_ids(np.arange(excess, dtype="int64"))
+                del self._entries[:excess]
+
+        if self._index_path is not None:
+            self._dirty = True
+            if self._save_task is None or self._save_task.done():
+                self._save_task = asyncio.create_task(self._save_pending())
@@ -1,14 +1,37 @@
-import replicate
-import os
+import hashlib
 from typing import Dict
-from dotenv import load_dotenv
+from ._replicate import run
+from ._output import extract_url
+from ._cache import cached_replicate
+from .errors import ServiceError
 
-load_dotenv()
+MMAUDIO_MODEL = "zsxkib/mmaudio:62871fb59889b2d7c13777f08deb3b36bdff88f7e1d53a50ad7694548a41b484"
+
+
+def _stable_seed(video_url: str, sound_effect: str) -> int:
+    """Derive a fixed seed from the inputs so identical requests give identical audio."""
+    digest = hashlib.sha256(f"{video_url}|{sound_effect}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF
+
+
+def _mmaudio_input(video_url: str, sound_effect: str) -> Dict:
+    """Build the MMAudio input parameters for one 5-second scene."""
+    return {
+        # A random seed (-1) would make cached results non-reproducible
+        "seed": _stable_seed(video_url, sound_effect),
+        "video": video_url,
+        "prompt": sound_effect,  # Use the specific sound effect from storyboard
+        "duration": 5,  # Match the 5-second video duration
+        "num_steps": 25,
+        "cfg_strength": 4.5,
+        "negative_prompt": "music",
+    }
 
 
 class AddSoundEffectService:
     @staticmethod
-    def add_sound_effect(video_url: str, sound_effect: str = "ambient") -> Dict[str, str]:
+    @cached_replicate(MMAUDIO_MODEL, _mmaudio_input)
+    async def add_sound_effect(video_url: str, sound_effect: str = "ambient") -> Dict[str, str]:
         """
         Add sound effects to a video using MMAudio model.
 
@@ -18,48 +41,29 @@ class AddSoundEffectService:
 
         Returns:
             Dict containing status, message, and processed video URL
-        """
-        try:
-            # Initialize Replicate client
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
 
-            # Use MMAudio model to add sound effects
-            output = replicate.run(
-                "zsxkib/mmaudio:62871fb59889b2d7c13777f08deb3b36bdff88f7e1d53a50ad7694548a41b484",
-                input={
-                    "seed": -1,
-                    "video": video_url,
-                    "prompt": sound_effect,  # Use the specific sound effect from storyboard
-                    "duration": 5,  # Match the 5-second video duration
-                    "num_steps": 25,
-                    "cfg_strength": 4.5,
-                    "negative_prompt": "music",
-                },
-            )
-
-            # Extract the video URL from the output
-            if hasattr(output, "url") and callable(getattr(output, "url")):
-                processed_video_url = output.url()
-            else:
-                processed_video_url = str(output)
+        Raises:
+            ServiceError: If the model returns no usable video URL
+        """
+        # Use MMAudio model to add sound effects
+        output = await run(
+            MMAUDIO_MODEL,
+            input=_mmaudio_input(video_url, sound_effect),
+        )
 
-            # Validate the URL
-            if not processed_video_url or not processed_video_url.startswith(
-                ("http://", "https://")
-            ):
-                return {
-                    "status": "error",
-                    "message": "Invalid video URL returned from sound effect service",
-                }
+        # Extract the URL from the model's FileOutput response
+        processed_video_url = extract_url(output)
 
-            return {
-                "status": "success",
-                "message": "Sound effects added successfully",
-                "video_url": processed_video_url,
-            }
+        # Validate that we received a video URL
+        if not processed_video_url:
+            raise ServiceError(
+                502,
+                "Invalid video URL returned from sound effect service",
+                raw_output=str(output),
+            )
 
-        except Exception as e:
-            return {
-                "status": "error",
-                "message": f"Failed to add sound effects: {str(e)}",
-            }
+        return {
+            "status": "success",
+            "message": "Sound effects added successfully",
+            "video_url": processed_video_url,
+        }
@@ -5,20 +5,77 @@ This service uses Gemini 2.5 Flash to expand character descriptions into detaile
 prompts for the Minimax image-01 model to generate high-quality character images.
 """
 
-import os
-import replicate
+import re
 from typing import Dict
-from dotenv import load_dotenv
+from ._replicate import stream
+from . import _cache as prompt_cache
+from ._output import strip_fence
+from ._semantic_cache import SemanticCache
+from .errors import ServiceError
+
+# Bump when the prompt template changes so stale expansions are not reused
+_TEMPLATE_ID = "character-prompt-v2"
+
+# Static instructions sent as the Gemini system instruction. Keep this text
+# byte-identical between calls and keep name/description out of it, so repeated
+# requests share a cacheable prefix and only pay for the short dynamic tail.
+SYSTEM_PREFIX = """\
+Expand the character description that follows into a detailed image generation prompt for a high-quality AI image model.
+
+Create a comprehensive prompt that includes:
+- Detailed physical appearance (facial features, body type, age, ethnicity)
+- Specific clothing description (colors, materials, style, fit)
+- Accessories and details (jewelry, bags, shoes, etc.)
+- Pose and positioning requirements
+- Background and lighting specifications
+- Technical quality requirements
+
+CRITICAL REQUIREMENTS:
+- FULL BODY: The character must be STANDING, and FRONT-FACING
+- BACKGROUND: "Plain solid black background" only - NO environment, NO props, NO background elements
+- FOCUS: Maximum focus on the character with minimal background distraction
+- STYLE: Use descriptive, specific language similar to professional photography briefs
+- LENGTH: Keep the final prompt under 1200 characters for optimal processing
+
+Return ONLY the detailed image generation prompt, no additional text or formatting.
+"""
+
+# Per-request tail appended after SYSTEM_PREFIX; only these slots vary between calls
+_CHAR_PROMPT_TMPL = "Character Name: {name}\nBasic Description: {description}\n"
+
+# Descriptions that differ only in the name reuse a cached expansion with the new
+# name substituted in
+_SEMANTIC_CACHE = SemanticCache("character_prompt", threshold=0.9)
+
+# Stands in for the character name in semantically cached prompts
+_NAME_SLOT = "\x00name\x00"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _name_pattern(name: str) -> "re.Pattern[str]":
+    # Whole-name matches only, so "Al" is not found inside "natural"; lookarounds
+    # instead of \b because names like "Dr. Jo" can start or end with punctuation
+    return re.compile(rf"(?<!\w){re.escape(name)}(?!\w)")
+
 
-# Load environment variables from .env file
-load_dotenv()
+def _to_template(prompt: str, name: str) -> str:
+    """Replace every mention of name in prompt with the name slot."""
+    return _name_pattern(name).sub(_NAME_SLOT, prompt)
+
+
+def _traits(description: str, name: str) -> str:
+    """The normalised description with the name taken out."""
+    return _normalize(_name_pattern(name).sub(" ", description))
 
 
 class CharacterPromptService:
     """Service for character prompt operations using AI-generated content."""
 
     @staticmethod
-    def create_character_prompt(description: str, name: str) -> Dict[str, str]:
+    async def create_character_prompt(description: str, name: str) -> Dict[str, str]:
         """
         Create a detailed character prompt using Gemini 2.5 Flash.
 
@@ -31,90 +88,84 @@ class CharacterPromptService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - prompt: Generated image generation prompt (if successful)
-                - raw_output: Raw AI response (if error)
-        """
-        try:  # Start try block to catch any exceptions during prompt generation
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-            # Create a detailed prompt for Gemini to expand the character description
-            # This prompt ensures specific formatting for image generation
-            prompt = f"""
-            Expand this character description into a detailed image generation prompt for a high-quality AI image model.
-            
-            Character Name: {name}
-            Basic Description: {description}
-            
-            Create a comprehensive prompt that includes:
-            - Detailed physical appearance (facial features, body type, age, ethnicity)
-            - Specific clothing description (colors, materials, style, fit)
-            - Accessories and details (jewelry, bags, shoes, etc.)
-            - Pose and positioning requirements
-            - Background and lighting specifications
-            - Technical quality requirements
-            
-            CRITICAL REQUIREMENTS:
-            - FULL BODY: The character must be STANDING, and FRONT-FACING
-            - BACKGROUND: "Plain solid black background" only - NO environment, NO props, NO background elements
-            - FOCUS: Maximum focus on the character with minimal background distraction
-            - STYLE: Use descriptive, specific language similar to professional photography briefs
-            - LENGTH: Keep the final prompt under 1200 characters for optimal processing
-            
-            
-            Return ONLY the detailed image generation prompt, no additional text or formatting.
-            """
-
-            # Call the Gemini 2.5 Flash model through Replicate API
-            # This sends our prompt to the AI model and gets back a streaming response
-            output = replicate.run(
-                "google/gemini-2.5-flash",  # Specify the exact model to use
-                input={  # Pass parameters to control the AI's behavior
-                    "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
-                    "prompt": prompt,  # The detailed prompt we created above
-                    "temperature": 0.8,  # Higher creativity for detailed descriptions
-                    "dynamic_thinking": False,  # Disable for faster response
-                    "max_output_tokens": 2000,  # Sufficient for detailed prompt generation
-                },
-            )
+                - prompt: Generated image generation prompt
 
-            # Initialize empty string to collect the AI's response
-            # Replicate returns an iterator that streams the response in chunks
-            generated_content = ""
-            # Loop through each chunk of the streaming response
-            for item in output:
-                # Convert each chunk to string and append to our content string
-                generated_content += str(item)
-
-            # Clean any markdown formatting that AI models might add
-            # Remove code block markers that could interfere with the prompt
-            if generated_content.startswith("```"):  # Check for markdown code blocks
-                # Remove ``` markers and strip whitespace
-                generated_content = generated_content.replace("```", "").strip()
-
-            # Validate that we have meaningful content
-            if len(generated_content.strip()) < 50:  # Check if response is too short
-                return {
-                    "status": "error",
-                    "message": "Generated prompt is too short. Please try again.",
-                    "raw_output": generated_content,
-                }
-
-            # Return successful response with the generated prompt
+        Raises:
+            ServiceError: If the generated prompt is too short to use
+        """
+        # Exact hit: same template, description and name
+        cache_key = prompt_cache.make_key(
+            "character_prompt", _TEMPLATE_ID, _normalize(description), name
+        )
+        cached = await prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Structural hit: the same description under another name, so only the name
+        # slot needs rewriting. Similar embeddings alone aren't enough: a different
+        # age, hair colour or outfit would come back with the cached character's
+        traits = _traits(description, name)
+        hit = await _SEMANTIC_CACHE.lookup(description)
+        if hit is not None and hit.get("traits") == traits:
             return {
-                "status": "success",  # Indicate successful generation
-                "message": "Character prompt created successfully",  # Success message
-                "prompt": generated_content.strip(),  # The actual image generation prompt
+                "status": "success",
+                "message": "Character prompt created successfully",
+                "prompt": hit["template"].replace(_NAME_SLOT, name),
             }
 
-        except (
-            Exception
-        ) as e:  # Catch any unexpected errors (API failures, network issues)
-            # Return generic error response for any other exceptions
-            return {
-                "status": "error",
-                "message": f"Failed to generate character prompt: {str(e)}",  # Include error details
-            }
+        # Only the per-request values go in the prompt; they must stay at the tail,
+        # after the static SYSTEM_PREFIX, or provider prompt caching stops hitting
+        prompt = _CHAR_PROMPT_TMPL.format(name=name, description=description)
+
+        # Call the Gemini 2.5 Flash model through Replicate API
+        # This sends our prompt to the AI model and gets back a streaming response
+        output = stream(
+            "google/gemini-2.5-flash",  # Specify the exact model to use
+            input={  # Pass parameters to control the AI's behavior
+                "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
+                "prompt": prompt,  # The character fields we created above
+                "system_instruction": SYSTEM_PREFIX,  # Static, cacheable instructions
+                "temperature": 0.8,  # Higher creativity for detailed descriptions
+                "dynamic_thinking": False,  # Disable for faster response
+                "max_output_tokens": 2000,  # Sufficient for detailed prompt generation
+            },
+        )
+
+        # Collect the AI's response chunks in a list and join once at the end
+        # Replicate returns an iterator that streams the response in chunks
+        parts = []
+        # Loop through each chunk of the streaming response
+        async for item in output:
+            # Stream events render to their text; plain strings are kept as-is
+            parts.append(item if isinstance(item, str) else str(item))
+        generated_content = "".join(parts)
+
+        # Clean any markdown formatting that AI models might add
+        # Remove code block markers that could interfere with the prompt
+        generated_content = strip_fence(generated_content)
+
+        # Validate that we have meaningful content
+        if len(generated_content.strip()) < 50:  # Check if response is too short
+            raise ServiceError(
+                502,
+                "Generated prompt is too short. Please try again.",
+                raw_output=generated_content,
+            )
+
+        # Build successful response with the generated prompt
+        result = {
+            "status": "success",  # Indicate successful generation
+            "message": "Character prompt created successfully",  # Success message
+            "prompt": generated_content.strip(),  # The actual image generation prompt
+        }
+
+        # Remember the expansion as-is for exact reuse, and with the name as an
+        # explicit slot for structural reuse under another name
+        await prompt_cache.put(cache_key, result, prompt_cache.PROMPT_CACHE_TTL)
+        await _SEMANTIC_CACHE.add(
+            description,
+            {"template": _to_template(result["prompt"], name), "traits": traits},
+        )
+        return result
@@ -6,20 +6,132 @@ character and setting images into cohesive scenes with specific positioning,
 posture, and camera angles.
 """
 
-import replicate
-import os
-from typing import Dict
-from dotenv import load_dotenv
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from ._replicate import stream
+from . import _cache as prompt_cache
+from ._output import strip_fence
+from ._semantic_cache import SemanticCache
+from .errors import ServiceError
 
-# Load environment variables from .env file
-load_dotenv()
+# Bump when the prompt template changes so stale prompts are not reused
+_TEMPLATE_ID = "combine-prompt-v3"
+
+# Static instructions sent as the Gemini system instruction. Keep this text
+# byte-identical between calls and keep the scene description out of it, so
+# repeated requests share a cacheable prefix and only pay for the dynamic tail.
+SYSTEM_PREFIX = """\
+Analyze the scene description that follows and create a detailed prompt for combining a character image with a setting image.
+
+Create a comprehensive combination prompt that includes:
+- Character's specific body position and posture
+- Where the character is positioned in the setting
+- Character's orientation (facing direction, body angle)
+- Camera angle that best captures the scene's mood and action
+- Lighting and atmosphere integration
+- Natural interaction between character and environment
+- Specific details about what the character is doing
+- Spatial relationships between character and setting elements
+
+Requirements for the combination:
+- Natural, descriptive language that flows well
+- Focus on the character's specific actions and positioning
+- Clear camera angle and perspective
+- Integration of character with the setting environment
+- Maintain the mood and atmosphere of the scene
+- Be specific about character placement and orientation
+- Use cinematic language for professional results
+
+IMPORTANT: Keep the final prompt under 200 words. Be concise but descriptive.
+
+Return ONLY the detailed combination prompt, no additional text or formatting.
+"""
+
+# Per-request tail appended after SYSTEM_PREFIX; only the scene description varies
+_COMBINE_PROMPT_TMPL = "Scene Description: {scene_description}\n"
+
+# Batch requests reuse SYSTEM_PREFIX verbatim and only append the output contract,
+# so single and batched calls still share the cacheable prefix
+_BATCH_SYSTEM_SUFFIX = """
+BATCH MODE: the input is a numbered list of K scene descriptions. Apply the instructions above to each scene independently.
+Return ONLY a JSON array of length K where element i is the combination prompt (a plain string) for scene i. No other text.
+"""
+
+_BATCH_SCENE_TMPL = "Scene {number}: {scene_description}\n"
+
+# Output budget per scene in a batch, matching the single-scene max_output_tokens
+_TOKENS_PER_SCENE = 350
+
+# Anything shorter can't describe a scene; don't spend a Gemini call on it
+MIN_SCENE_DESCRIPTION_LENGTH = 10
+
+# Near-duplicate scene descriptions reuse a previously generated combination prompt
+_SEMANTIC_CACHE = SemanticCache("combine_prompt", threshold=0.9)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _cache_key(scene_description: str) -> str:
+    return prompt_cache.make_key(
+        "combine_prompt", _TEMPLATE_ID, _normalize(scene_description)
+    )
+
+
+async def _lookup(scene_description: str) -> Tuple[str, Optional[Dict[str, str]]]:
+    """Return the exact cache key and any cached (exact or semantic) result."""
+    # Exact hit: same template and scene description
+    cache_key = _cache_key(scene_description)
+    cached = await prompt_cache.get(cache_key)
+    if cached is not None:
+        return cache_key, cached
+
+    # Semantic hit: a reworded but equivalent scene description
+    return cache_key, await _SEMANTIC_CACHE.lookup(scene_description)
+
+
+async def _store(cache_key: str, scene_description: str, result: Dict[str, str]) -> None:
+    await prompt_cache.put(cache_key, result, prompt_cache.PROMPT_CACHE_TTL)
+    await _SEMANTIC_CACHE.add(scene_description, result)
+
+
+async def _stream(
+    prompt: str, system_instruction: str, max_output_tokens: int
+) -> AsyncIterator[str]:
+    # Call the Gemini 2.5 Flash model through Replicate API
+    # This sends our prompt to the AI model and gets back a streaming response
+    output = stream(
+        "google/gemini-2.5-flash",  # Specify the exact model to use
+        input={  # Pass parameters to control the AI's behavior
+            "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
+            "prompt": prompt,  # The scene description(s) we created above
+            "system_instruction": system_instruction,  # Static, cacheable instructions
+            "temperature": 0.7,  # Balanced creativity for scene analysis
+            "dynamic_thinking": False,  # Disable for faster response
+            "max_output_tokens": max_output_tokens,
+        },
+    )
+
+    # Replicate returns an iterator that streams the response in chunks;
+    # hand each one on as soon as it arrives
+    async for item in output:
+        # Stream events render to their text; plain strings are kept as-is
+        yield item if isinstance(item, str) else str(item)
+
+
+async def _generate(prompt: str, system_instruction: str, max_output_tokens: int) -> str:
+    # Collect the AI's response chunks in a list and join once at the end
+    parts = [chunk async for chunk in _stream(prompt, system_instruction, max_output_tokens)]
+    return "".join(parts)
 
 
 class CombinePromptService:
     """Service for prompt combination operations using AI-generated content."""
 
     @staticmethod
-    def combine_prompt(scene_description: str) -> Dict[str, str]:
+    async def combine_prompt(scene_description: str) -> Dict[str, str]:
         """
         Create a detailed combination prompt using Gemini 2.5 Flash.
 
@@ -31,94 +143,165 @@ class CombinePromptService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - prompt: Generated combination prompt (if successful)
-                - raw_output: Raw AI response (if error)
+                - prompt: Generated combination prompt
+
+        Raises:
+            ServiceError: 422 if the scene description is too short, 502 if the
+                generated prompt is too short
+        """
+        # Same work as the streaming variant; only the final result is kept
+        async for event, data in CombinePromptService.stream_combine_prompt(
+            scene_description
+        ):
+            if event == "result":
+                return data
+
+    @staticmethod
+    async def stream_combine_prompt(
+        scene_description: str,
+    ) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
         """
-        try:  # Start try block to catch any exceptions during prompt generation
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-            # Create a detailed prompt for Gemini to analyze the scene and create combination instructions
-            # This prompt focuses on character positioning, posture, and camera angles
-            prompt = f"""
-            Analyze this scene description and create a detailed prompt for combining a character image with a setting image.
-            
-            Scene Description: {scene_description}
-            
-            Create a comprehensive combination prompt that includes:
-            - Character's specific body position and posture
-            - Where the character is positioned in the setting
-            - Character's orientation (facing direction, body angle)
-            - Camera angle that best captures the scene's mood and action
-            - Lighting and atmosphere integration
-            - Natural interaction between character and environment
-            - Specific details about what the character is doing
-            - Spatial relationships between character and setting elements
-            
-            Requirements for the combination:
-            - Natural, descriptive language that flows well
-            - Focus on the character's specific actions and positioning
-            - Clear camera angle and perspective
-            - Integration of character with the setting environment
-            - Maintain the mood and atmosphere of the scene
-            - Be specific about character placement and orientation
-            - Use cinematic language for professional results
-            
-            IMPORTANT: Keep the final prompt under 200 words. Be concise but descriptive.
-            
-            Return ONLY the detailed combination prompt, no additional text or formatting.
-            """
-
-            # Call the Gemini 2.5 Flash model through Replicate API
-            # This sends our prompt to the AI model and gets back a streaming response
-            output = replicate.run(
-                "google/gemini-2.5-flash",  # Specify the exact model to use
-                input={  # Pass parameters to control the AI's behavior
-                    "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
-                    "prompt": prompt,  # The detailed prompt we created above
-                    "temperature": 0.7,  # Balanced creativity for scene analysis
-                    "dynamic_thinking": False,  # Disable for faster response
-                    "max_output_tokens": 1500,  # Sufficient for detailed combination prompt
-                },
+        Create a combination prompt while forwarding Gemini's output as it decodes.
+
+        Callers can start on the text (validation, similarity checks, showing it to
+        the user) before the model has finished the tail of the prompt.
+
+        Args:
+            scene_description: Scene description for prompt combination
+
+        Yields:
+            (event, data) tuples:
+                - ("chunk", {"text": ...}) for each piece of raw model output
+                - ("result", ...) once, shaped like combine_prompt's response
+
+        Raises:
+            ServiceError: As combine_prompt; chunks already yielded stay yielded
+        """
+        # Preflight: reject empty or trivial input before any cache or Replicate work,
+        # and drop surrounding whitespace that would only add prompt tokens
+        scene_description = scene_description.strip() if scene_description else ""
+        if len(scene_description) < MIN_SCENE_DESCRIPTION_LENGTH:
+            raise ServiceError(
+                422, "Scene description is too short. Please provide more detail."
+            )
+
+        # Exact or semantic hit from an earlier, equivalent scene description
+        cache_key, cached = await _lookup(scene_description)
+        if cached is not None:
+            # A cached prompt is already complete; there is nothing to stream
+            yield "result", cached
+            return
+
+        # Only the scene description goes in the prompt; it must stay at the tail,
+        # after the static SYSTEM_PREFIX, or provider prompt caching stops hitting
+        prompt = _COMBINE_PROMPT_TMPL.format(scene_description=scene_description)
+
+        # ~200 words x 1.6 tokens; a smaller budget decodes faster
+        parts = []
+        async for chunk in _stream(prompt, SYSTEM_PREFIX, _TOKENS_PER_SCENE):
+            parts.append(chunk)
+            yield "chunk", {"text": chunk}
+        generated_content = "".join(parts)
+
+        # Clean any markdown formatting that AI models might add
+        # Remove code block markers that could interfere with the prompt
+        generated_content = strip_fence(generated_content)
+
+        # Validate that we have meaningful content
+        if len(generated_content.strip()) < 30:  # Check if response is too short
+            raise ServiceError(
+                502,
+                "Generated prompt is too short. Please try again.",
+                raw_output=generated_content,
+            )
+
+        # Build successful response with the generated prompt
+        result = {
+            "status": "success",  # Indicate successful generation
+            "message": "Combine prompt created successfully",  # Success message
+            "prompt": generated_content.strip(),  # The actual combination prompt
+        }
+
+        await _store(cache_key, scene_description, result)
+        yield "result", result
+    @staticmethod
+    async def combine_prompts_batch(scene_descriptions: List[str]) -> List[Dict[str, str]]:
+        """
+        Create combination prompts for many scenes with a single Gemini call.
+
+        Cached scenes are answered from the cache; the rest are sent together as a
+        numbered list and Gemini returns a JSON array with one prompt per scene.
+        If that reply can't be parsed, each remaining scene falls back to
+        combine_prompt.
+
+        Args:
+            scene_descriptions: Scene descriptions, one per scene
+
+        Returns:
+            List of combine_prompt results, in the same order as scene_descriptions
+
+        Raises:
+            ServiceError: 422 naming the first scene description that is too short,
+                or the first failure among the scenes that fell back to combine_prompt
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(scene_descriptions)
+        pending: List[Tuple[int, str, str]] = []  # (index, scene, cache key) to generate
+
+        for index, scene_description in enumerate(scene_descriptions):
+            scene_description = scene_description.strip() if scene_description else ""
+            if len(scene_description) < MIN_SCENE_DESCRIPTION_LENGTH:
+                # A trivial scene is the client's mistake; reject the batch before any
+                # Gemini call, naming the scene
+                raise ServiceError(
+                    422,
+                    f"Scene description {index + 1} is too short. Please provide more detail.",
+                )
+            cache_key, cached = await _lookup(scene_description)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, scene_description, cache_key))
+
+        # A batch of one gains nothing over the single-scene prompt
+        if len(pending) > 1:
+            prompt = "".join(
+                _BATCH_SCENE_TMPL.format(number=number, scene_description=scene)
+                for number, (_, scene, _) in enumerate(pending, start=1)
+            )
+            try:
+                generated_content = await _generate(
+                    prompt,
+                    SYSTEM_PREFIX + _BATCH_SYSTEM_SUFFIX,
+                    _TOKENS_PER_SCENE * len(pending),
+                )
+                prompts = json.loads(strip_fence(generated_content))
+            except Exception:  # Bad JSON or a failed call; retry scene by scene below
+                prompts = None
+
+            # Only trust the array if it lines up with the scenes and every prompt is usable
+            if (
+                isinstance(prompts, list)
+                and len(prompts) == len(pending)
+                and all(isinstance(p, str) and len(p.strip()) >= 30 for p in prompts)
+            ):
+                for (index, scene_description, cache_key), generated in zip(pending, prompts):
+                    result = {
+                        "status": "success",
+                        "message": "Combine prompt created successfully",
+                        "prompt": generated.strip(),
+                    }
+                    await _store(cache_key, scene_description, result)
+                    results[index] = result
+                pending = []
+
+        # Anything the batch didn't answer goes through the per-scene path concurrently
+        if pending:
+            fallback = await asyncio.gather(
+                *[CombinePromptService.combine_prompt(scene) for _, scene, _ in pending]
             )
+            for (index, _, _), result in zip(pending, fallback):
+                results[index] = result
 
-            # Initialize empty string to collect the AI's response
-            # Replicate returns an iterator that streams the response in chunks
-            generated_content = ""
-            # Loop through each chunk of the streaming response
-            for item in output:
-                # Convert each chunk to string and append to our content string
-                generated_content += str(item)
-
-            # Clean any markdown formatting that AI models might add
-            # Remove code block markers that could interfere with the prompt
-            if generated_content.startswith("```"):  # Check for markdown code blocks
-                # Remove ``` markers and strip whitespace
-                generated_content = generated_content.replace("```", "").strip()
-
-            # Validate that we have meaningful content
-            if len(generated_content.strip()) < 30:  # Check if response is too short
-                return {
-                    "status": "error",
-                    "message": "Generated prompt is too short. Please try again.",
-                    "raw_output": generated_content,
-                }
-
-            # Return successful response with the generated prompt
-            return {
-                "status": "success",  # Indicate successful generation
-                "message": "Combine prompt created successfully",  # Success message
-                "prompt": generated_content.strip(),  # The actual combination prompt
-            }
-
-        except (
-            Exception
-        ) as e:  # Catch any unexpected errors (API failures, network issues)
-            # Return generic error response for any other exceptions
-            return {
-                "status": "error",
-                "message": f"Failed to generate combine prompt: {str(e)}",  # Include error details
-            }
+        return results
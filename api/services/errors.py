@@ -0,0 +1,19 @@
+"""
+Typed errors raised by services.
+
+Services raise these instead of returning error dicts; the handlers registered
+in api.main turn them into the usual {"status": "error", ...} body with a real
+HTTP status code.
+"""
+
+from typing import Optional
+
+
+class ServiceError(Exception):
+    """A service failed in a way the client should see, with the HTTP status to use."""
+
+    def __init__(self, status: int, message: str, raw_output: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.raw_output = raw_output
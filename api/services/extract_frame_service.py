@@ -7,20 +7,30 @@ frame image URL. When return_first_frame is False, the model extracts a represen
 frame from the video (not necessarily the first frame).
 """
 
-import replicate
-import os
 from typing import Dict
-from dotenv import load_dotenv
+from ._replicate import run
+from ._output import extract_url
+from ._cache import cached_replicate
+from .errors import ServiceError
 
-# Load environment variables from .env file
-load_dotenv()
+FRAME_EXTRACTOR_MODEL = "lucataco/frame-extractor:c02b3c1df64728476b1c21b0876235119e6ac08b0c9b8a99b82c5f0e0d42442d"
+
+
+def _frame_input(video_url: str) -> Dict:
+    """Build the frame-extractor input parameters for one video."""
+    return {
+        "video": video_url,
+        "return_first_frame": False,  # Let the model choose the best representative frame
+    }
 
 
 class ExtractFrameService:
     """Service for extracting frames from videos using AI models."""
 
     @staticmethod
-    def extract_frame(video_url: str) -> Dict[str, str]:
+    # The frame is fixed for a given video, so retries and re-runs reuse it
+    @cached_replicate(FRAME_EXTRACTOR_MODEL, _frame_input)
+    async def extract_frame(video_url: str) -> Dict[str, str]:
         """
         Extract a frame from a video using Replicate's lucataco/frame-extractor model.
 
@@ -33,49 +43,34 @@ class ExtractFrameService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - frame_url: URL of the extracted frame (if successful)
-        """
-        try:
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
+                - frame_url: URL of the extracted frame
 
-            # Use Replicate's lucataco/frame-extractor model for intelligent frame extraction
-            # With return_first_frame=False, the model selects a representative frame
-            # rather than just the first frame, often providing better visual results
-            output = replicate.run(
-                "lucataco/frame-extractor:c02b3c1df64728476b1c21b0876235119e6ac08b0c9b8a99b82c5f0e0d42442d",
-                input={
-                    "video": video_url,
-                    "return_first_frame": False,  # Let the model choose the best representative frame
-                },
-            )
-
-            # Handle the output - extract the frame URL from the model response
-            # The lucataco/frame-extractor returns a FileOutput object with a URL method
-            if hasattr(output, "url") and callable(getattr(output, "url")):
-                frame_url = output.url()  # Get the URL of the extracted frame image
-            else:
-                frame_url = str(output)  # Fallback to string conversion if needed
+        Raises:
+            ServiceError: If the model returns no usable frame URL
+        """
+        # Use Replicate's lucataco/frame-extractor model for intelligent frame extraction
+        # With return_first_frame=False, the model selects a representative frame
+        # rather than just the first frame, often providing better visual results
+        output = await run(
+            FRAME_EXTRACTOR_MODEL,
+            input=_frame_input(video_url),
+        )
 
-            # Validate that we got a valid URL from the frame extraction
-            if not frame_url or not isinstance(frame_url, str):
-                return {
-                    "status": "error",
-                    "message": "Failed to extract frame. Invalid response from model.",
-                    "raw_output": str(output),
-                }
+        # Extract the URL from the model's FileOutput response
+        frame_url = extract_url(output)
 
-            return {
-                "status": "success",
-                "message": "Frame extracted successfully",
-                "frame_url": frame_url,
-            }
+        # Validate that we got a valid URL from the frame extraction
+        if not frame_url or not isinstance(frame_url, str):
+            raise ServiceError(
+                502,
+                "Failed to extract frame. Invalid response from model.",
+                raw_output=str(output),
+            )
 
-        except Exception as e:
-            return {
-                "status": "error",
-                "message": f"Failed to extract frame: {str(e)}",
-            }
+        return {
+            "status": "success",
+            "message": "Frame extracted successfully",
+            "frame_url": frame_url,
+        }
@@ -5,20 +5,40 @@ This service uses the ByteDance Seedance-1-pro model via Replicate to generate
 high-quality videos from prompts and initial images.
 """
 
-import replicate
-import os
-from typing import Dict
-from dotenv import load_dotenv
+import asyncio
+from typing import AsyncIterator, Dict, Tuple
+from ._replicate import create_prediction, run
+from ._output import extract_url
+from ._cache import cached_replicate
+from .errors import ServiceError
 
-# Load environment variables from .env file
-load_dotenv()
+SEEDANCE_MODEL = "bytedance/seedance-1-pro"
+
+# Seconds between prediction status checks while streaming progress
+PROGRESS_POLL_INTERVAL = 2.0
+
+
+def _seedance_input(prompt: str, initial_image: str) -> Dict:
+    """Build the Seedance-1-pro input parameters for one 5-second scene."""
+    return {  # Pass parameters to control the video generation
+        "fps": 24,  # Frames per second for smooth video playback
+        "prompt": prompt,  # The detailed video generation prompt
+        "image": initial_image,  # URL of the initial image for video generation
+        "duration": 5,  # Video duration in seconds
+        "resolution": "480p",  # High definition resolution
+        "aspect_ratio": "16:9",  # Widescreen aspect ratio
+        "camera_fixed": False,  # Allow camera movement for dynamic shots
+    }
 
 
 class GenerateVideoService:
     """Service for video generation operations using AI-generated content."""
 
     @staticmethod
-    def generate_video(prompt: str, initial_image: str) -> Dict[str, str]:
+    # Seedance is the slowest and most expensive call in the workflow; the same
+    # prompt and starting image (a retry, a re-run, a repeated scene) reuse the video
+    @cached_replicate(SEEDANCE_MODEL, _seedance_input)
+    async def generate_video(prompt: str, initial_image: str) -> Dict[str, str]:
         """
         Generate a video using ByteDance Seedance-1-pro model.
 
@@ -31,60 +51,89 @@ class GenerateVideoService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - video_url: URL of the generated video (if successful)
-                - raw_output: Raw API response (if error)
+                - video_url: URL of the generated video
+
+        Raises:
+            ServiceError: If the model returns no usable video URL
         """
-        try:  # Start try block to catch any exceptions during video generation
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-            # Call the ByteDance Seedance-1-pro model through Replicate API
-            # This sends our prompt and initial image to the video generation model
-            output = replicate.run(
-                "bytedance/seedance-1-pro",  # Specify the exact ByteDance model to use
-                input={  # Pass parameters to control the video generation
-                    "fps": 24,  # Frames per second for smooth video playback
-                    "prompt": prompt,  # The detailed video generation prompt
-                    "image": initial_image,  # URL of the initial image for video generation
-                    "duration": 5,  # Video duration in seconds
-                    "resolution": "480p",  # High definition resolution
-                    "aspect_ratio": "16:9",  # Widescreen aspect ratio
-                    "camera_fixed": False,  # Allow camera movement for dynamic shots
-                },
+        # Call the ByteDance Seedance-1-pro model through Replicate API
+        # This sends our prompt and initial image to the video generation model
+        output = await run(
+            SEEDANCE_MODEL,  # Specify the exact ByteDance model to use
+            input=_seedance_input(prompt, initial_image),
+        )
+
+        # Extract the URL from the model's FileOutput response
+        video_url = extract_url(output)
+
+        # Validate that we received a valid video URL
+        if not video_url or not isinstance(video_url, str):  # Check if URL is valid
+            raise ServiceError(
+                502,
+                "Failed to generate video. Invalid response from model.",
+                raw_output=str(output),
             )
 
-            # Extract the generated video URL from the response
-            # ByteDance Seedance-1-pro model returns a single FileOutput object with url() method
-            if hasattr(output, "url") and callable(getattr(output, "url")):
-                # Direct FileOutput object with url() method
-                video_url = output.url()
-            else:
-                # Fallback if output is not a FileOutput object
-                video_url = str(output)
-
-            # Validate that we received a valid video URL
-            if not video_url or not isinstance(video_url, str):  # Check if URL is valid
-                return {
-                    "status": "error",
-                    "message": "Failed to generate video. Invalid response from model.",
-                    "raw_output": str(output),
+        # Return successful response with the generated video URL
+        return {
+            "status": "success",  # Indicate successful generation
+            "message": "Video generated successfully",  # Success message
+            "video_url": video_url,  # The URL of the generated video
+        }
+
+    @staticmethod
+    async def stream_video(
+        prompt: str, initial_image: str
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Generate a video while reporting progress of the Replicate prediction.
+
+        Instead of blocking until the job is done, this creates the prediction and
+        polls it, so callers can forward progress to the client as it happens.
+
+        Args:
+            prompt: Detailed video generation prompt (from video prompt service)
+            initial_image: URL of the initial image for video generation
+
+        Yields:
+            (event, data) tuples:
+                - ("progress", {"status": ..., "percentage": ...}) while running
+                - ("result", ...) once, shaped like generate_video's response
+
+        Raises:
+            ServiceError: If the prediction fails or returns no usable video URL
+        """
+        # The Seedance slot is held until the prediction finishes
+        async with create_prediction(
+            SEEDANCE_MODEL, _seedance_input(prompt, initial_image)
+        ) as prediction:
+            # Report status until the prediction reaches a terminal state
+            while prediction.status not in ("succeeded", "failed", "canceled"):
+                progress = prediction.progress
+                yield "progress", {
+                    "status": prediction.status,
+                    "percentage": progress.percentage if progress else None,
                 }
+                await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+                await prediction.async_reload()
 
-            # Return successful response with the generated video URL
-            return {
-                "status": "success",  # Indicate successful generation
-                "message": "Video generated successfully",  # Success message
-                "video_url": video_url,  # The URL of the generated video
-            }
+            if prediction.status != "succeeded":
+                raise ServiceError(
+                    502, f"Failed to generate video: {prediction.error or prediction.status}"
+                )
+
+            video_url = extract_url(prediction.output)
+            if not video_url:
+                raise ServiceError(
+                    502,
+                    "Failed to generate video. Invalid response from model.",
+                    raw_output=str(prediction.output),
+                )
 
-        except (
-            Exception
-        ) as e:  # Catch any unexpected errors (API failures, network issues)
-            # Return generic error response for any other exceptions
-            return {
-                "status": "error",
-                "message": f"Failed to generate video: {str(e)}",  # Include error details
+            yield "result", {
+                "status": "success",
+                "message": "Video generated successfully",
+                "video_url": video_url,
             }
@@ -1,112 +1,473 @@
 """
-Service for merging multiple videos using MoviePy.
+Service for merging multiple videos.
+
+Clips with identical streams are joined losslessly with ffmpeg's concat demuxer;
+anything else falls back to a MoviePy re-encode. With MERGE_S3_BUCKET set, the
+result goes to object storage instead of the project directory.
 """
 
+import asyncio
+import json
+import logging
 import os
+import shutil
+import subprocess
 import tempfile
-import requests
-from typing import Dict, List
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
 from moviepy import VideoFileClip, concatenate_videoclips
 
+from .errors import ServiceError
+
+logger = logging.getLogger(__name__)
+
+# Stream downloads to disk in small chunks so memory stays flat regardless of video size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_CONCURRENCY = 8
+
+# Files at least this big are split into RANGE_PARTS parallel range requests
+RANGE_MIN_SIZE = 8 * 1024 * 1024
+RANGE_PARTS = 4
+
+# MoviePy rendering is blocking, so it runs on its own pool where a few long
+# merges can't starve FastAPI's shared threadpool
+RENDER_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MERGE_WORKERS", "4")), thread_name_prefix="merge"
+)
+
+# The lossless concat fast path needs both binaries on PATH
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+_STREAM_FIELDS = (
+    "codec_type,codec_name,width,height,sample_aspect_ratio,r_frame_rate,sample_rate,channels"
+)
+_CONCAT_ARGS = ["-v", "error", "-f", "concat", "-safe", "0", "-i"]
+
+# Set MERGE_S3_BUCKET to upload merged videos (S3 or any S3-compatible store such
+# as R2, configured through the usual AWS_* variables) and return a presigned URL
+MERGE_S3_BUCKET = os.getenv("MERGE_S3_BUCKET")
+MERGE_S3_PREFIX = os.getenv("MERGE_S3_PREFIX", "merged/")
+MERGE_URL_EXPIRY = int(os.getenv("MERGE_URL_EXPIRY", "86400"))
+
+
+async def _download_stream(client: httpx.AsyncClient, url: str, path: str) -> None:
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+
+async def _download_range(
+    client: httpx.AsyncClient, url: str, fd: int, start: int, end: int
+) -> None:
+    async with client.stream("GET", url, headers={"Range": f"bytes={start}-{end}"}) as response:
+        if response.status_code != 206:  # Server ignored the range; the whole body would follow
+            raise ValueError(f"Range request returned {response.status_code}")
+        offset = start
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+        if offset != end + 1:
+            raise ValueError(f"Range {start}-{end} ended early at byte {offset}")
+
+
+async def _download_ranges(
+    client: httpx.AsyncClient, url: str, path: str, size: int
+) -> None:
+    # Each part lands at its own offset in a preallocated file, so parts can finish in any order
+    part_size = -(-size // RANGE_PARTS)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    parts: List[asyncio.Task] = []
+    try:
+        os.ftruncate(fd, size)
+        parts = [
+            asyncio.create_task(
+                _download_range(client, url, fd, start, min(start + part_size, size) - 1)
+            )
+            for start in range(0, size, part_size)
+        ]
+        await asyncio.gather(*parts)
+    finally:
+        # A failed part must not leave the others writing through fd after it is
+        # closed; the fallback download would likely reopen the same descriptor
+        for task in parts:
+            task.cancel()
+        await asyncio.gather(*parts, return_exceptions=True)
+        os.close(fd)
+
+
+async def _download(client: httpx.AsyncClient, url: str, path: str) -> None:
+    # One TCP stream caps throughput on long-haul links, so large files that
+    # support byte ranges are fetched as several parallel parts
+    if hasattr(os, "pwrite"):  # Not available on Windows
+        try:
+            head = await client.head(url)
+            size = int(head.headers.get("content-length", 0))
+            if (
+                head.status_code == 200
+                and head.headers.get("accept-ranges") == "bytes"
+                and size >= RANGE_MIN_SIZE
+            ):
+                await _download_ranges(client, url, path, size)
+                return
+        except (httpx.HTTPError, ValueError):
+            # Any problem with the ranged path just means a plain download
+            pass
+    await _download_stream(client, url, path)
+
+
+def _download_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=30,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=DOWNLOAD_CONCURRENCY),
+    )
+
+
+def _raise_download_error(results: List) -> None:
+    """Raise for the first failed download; returns if they all succeeded."""
+    for i, result in enumerate(results):
+        if isinstance(result, BaseException):
+            # The URL came from the client, but fetching it is the upstream's failure
+            raise ServiceError(
+                502, f"Failed to download or process video {i + 1}: {str(result)}"
+            )
+
+
+def _merged(merged_video_path: str, video_count: int) -> Dict[str, str]:
+    return {
+        "status": "success",
+        "message": f"Successfully merged {video_count} videos",
+        "merged_video_path": merged_video_path,
+        "merged_video_url": f"file://{merged_video_path}",
+    }
+
+
+def _uploaded(url: str, video_count: int) -> Dict[str, str]:
+    return {
+        "status": "success",
+        "message": f"Successfully merged {video_count} videos",
+        "merged_video_url": url,
+    }
+
+
+def _s3():
+    # Only needed when MERGE_S3_BUCKET is set, so import boto3 lazily
+    import boto3
+
+    return boto3.client("s3")
+
+
+def _presigned_url(s3, key: str) -> str:
+    return s3.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": MERGE_S3_BUCKET, "Key": key},
+        ExpiresIn=MERGE_URL_EXPIRY,
+    )
+
+
+def _new_key() -> str:
+    return f"{MERGE_S3_PREFIX}{uuid.uuid4().hex}.mp4"
+
+
+def _stream_signature(video_path: str) -> Tuple:
+    """Codec, geometry and timing of every stream; inputs must match for a stream copy."""
+    probe = subprocess.run(
+        [
+            FFPROBE,
+            "-v",
+            "error",
+            "-show_entries",
+            f"stream={_STREAM_FIELDS}",
+            "-of",
+            "json",
+            video_path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    streams = json.loads(probe.stdout)["streams"]
+    return tuple(sorted(tuple(sorted(stream.items())) for stream in streams))
+
+
+def _can_stream_copy(video_paths: List[str]) -> bool:
+    """True when ffmpeg is available and every input has identical streams."""
+    if not (FFMPEG and FFPROBE):
+        return False
+    try:
+        signatures = {_stream_signature(path) for path in video_paths}
+    except (subprocess.CalledProcessError, ValueError, KeyError):
+        return False
+    return len(signatures) == 1  # Mixed codecs, sizes or frame rates need a real re-encode
+
+
+def _concat_list(video_paths: List[str]) -> str:
+    list_path = os.path.join(os.path.dirname(video_paths[0]), "list.txt")
+    with open(list_path, "w") as f:
+        f.writelines(f"file '{path}'\n" for path in video_paths)
+    return list_path
+
+
+def _concat_copy(list_path: str, merged_video_path: str) -> bool:
+    """Join the inputs with ffmpeg's concat demuxer without re-encoding."""
+    # Like the re-encode path: write a unique part file and rename it into place,
+    # so concurrent merges don't interleave and readers never see a partial file
+    partial_path = f"{merged_video_path}.{uuid.uuid4().hex}.part.mp4"
+    try:
+        result = subprocess.run(
+            [FFMPEG, "-y", *_CONCAT_ARGS, list_path, "-c", "copy", partial_path],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            return False
+        os.replace(partial_path, merged_video_path)
+        return True
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def _upload_concat(list_path: str) -> Optional[str]:
+    """Stream-copy straight into an S3 multipart upload; returns a presigned URL or None."""
+    from boto3.s3.transfer import TransferConfig
+
+    s3 = _s3()
+    key = _new_key()
+    # Fragmented MP4 needs no seek back to write the moov atom, so it can go to a pipe
+    process = subprocess.Popen(
+        [
+            FFMPEG,
+            *_CONCAT_ARGS,
+            list_path,
+            "-c",
+            "copy",
+            "-f",
+            "mp4",
+            "-movflags",
+            "frag_keyframe+empty_moov",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        s3.upload_fileobj(
+            process.stdout,
+            MERGE_S3_BUCKET,
+            key,
+            Config=TransferConfig(multipart_chunksize=8 * 1024 * 1024, max_concurrency=4),
+        )
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:  # A truncated upload must not be handed out
+        s3.delete_object(Bucket=MERGE_S3_BUCKET, Key=key)
+        return None
+    return _presigned_url(s3, key)
+
+
+def _finish(merged_video_path: str, video_count: int) -> Dict[str, str]:
+    """Upload a locally merged file when a bucket is configured, else return it as-is."""
+    if MERGE_S3_BUCKET:
+        try:
+            s3 = _s3()
+            key = _new_key()
+            s3.upload_file(merged_video_path, MERGE_S3_BUCKET, key)
+            return _uploaded(_presigned_url(s3, key), video_count)
+        except Exception:
+            logger.exception("Upload of merged video failed, keeping the local file")
+    return _merged(merged_video_path, video_count)
+
+
+def _reencode(video_paths: List[str], merged_video_path: str) -> Dict[str, str]:
+    """Decode and re-encode the inputs with MoviePy; works for any mix of streams."""
+    video_clips = []
+    try:
+        for i, video_path in enumerate(video_paths):
+            try:
+                # Load video clip with MoviePy
+                video_clips.append(VideoFileClip(video_path))
+            except Exception as e:
+                # Downloaded fine but isn't a video MoviePy can read
+                raise ServiceError(
+                    422, f"Failed to download or process video {i + 1}: {str(e)}"
+                )
+
+        # Concatenate all video clips
+        merged_clip = concatenate_videoclips(video_clips)
+        # Render next to the final path so the move below is a rename, not a copy,
+        # and readers never see a half-written merged_video.mp4. The temporary audio
+        # track goes in the managed temp dir instead of the working directory.
+        partial_path = f"{merged_video_path}.{uuid.uuid4().hex}.part.mp4"
+        try:
+            merged_clip.write_videofile(
+                partial_path,
+                codec="libx264",
+                audio_codec="aac",
+                temp_audiofile=os.path.join(
+                    os.path.dirname(video_paths[0]), "temp-audio.m4a"
+                ),
+                remove_temp=True,
+            )
+            shutil.move(partial_path, merged_video_path)
+        finally:
+            merged_clip.close()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        return _merged(merged_video_path, len(video_paths))
+
+    except ServiceError:
+        raise
+    except Exception as e:
+        # A render failure is ours, not the client's
+        raise ServiceError(500, f"Failed to merge videos: {str(e)}")
+
+    finally:
+        # Close all clips to free memory
+        for clip in video_clips:
+            clip.close()
+
+
+def _render(video_paths: List[str]) -> Dict[str, str]:
+    """Concatenate the downloaded videos into merged_video.mp4 or object storage (blocking)."""
+    # Save merged video to project directory
+    output_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    merged_video_path = os.path.join(output_dir, "merged_video.mp4")
+    video_count = len(video_paths)
+
+    # Seedance clips share codec, resolution and frame rate, so they can usually
+    # be copied as-is; MoviePy is only needed when the streams differ
+    if _can_stream_copy(video_paths):
+        list_path = _concat_list(video_paths)
+        if MERGE_S3_BUCKET:
+            try:
+                url = _upload_concat(list_path)
+            except Exception:
+                logger.exception("Streaming upload of merged video failed")
+                url = None
+            if url is not None:
+                return _uploaded(url, video_count)
+        if _concat_copy(list_path, merged_video_path):
+            return _finish(merged_video_path, video_count)
+
+    _reencode(video_paths, merged_video_path)
+    return _finish(merged_video_path, video_count)
+
 
 class MergeVideosService:
     """Service for merging multiple videos into a single video."""
 
     @staticmethod
-    def merge_videos(video_urls: List[str]) -> Dict[str, str]:
+    async def merge_videos(video_urls: List[str]) -> Dict[str, str]:
         """
-        Merge multiple videos into a single video using MoviePy.
+        Merge multiple videos into a single video.
 
-        This method downloads videos from URLs, concatenates them using MoviePy,
-        and uploads the merged video to a temporary location for access.
+        This method downloads all videos concurrently, concatenates them (stream
+        copy when possible, MoviePy otherwise), and writes the merged video to the
+        project directory.
 
         Args:
             video_urls: List of video URLs to merge
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - merged_video_url: URL of the merged video (if successful)
+                - merged_video_url: URL of the merged video
+
+        Raises:
+            ServiceError: 422 for fewer than 2 videos or one MoviePy can't read, 502
+                if a download fails, 500 if the merge itself fails
         """
-        try:
-            # Validate input
-            if not video_urls or len(video_urls) < 2:
-                return {
-                    "status": "error",
-                    "message": "At least 2 video URLs are required for merging",
-                }
-
-            # Create temporary directory for processing
-            with tempfile.TemporaryDirectory() as temp_dir:
-                video_clips = []
-
-                # Download and process each video
-                for i, video_url in enumerate(video_urls):
-                    try:
-                        # Download video to temporary file
-                        response = requests.get(video_url, timeout=30)
-                        response.raise_for_status()
-
-                        # Save to temporary file
-                        temp_video_path = os.path.join(temp_dir, f"video_{i}.mp4")
-                        with open(temp_video_path, "wb") as f:
-                            f.write(response.content)
-
-                        # Load video clip with MoviePy
-                        video_clip = VideoFileClip(temp_video_path)
-                        video_clips.append(video_clip)
-
-                    except Exception as e:
-                        # Clean up any loaded clips before returning error
-                        for clip in video_clips:
-                            clip.close()
-                        return {
-                            "status": "error",
-                            "message": f"Failed to download or process video {i + 1}: {str(e)}",
-                        }
+        # Validate input
+        if not video_urls or len(video_urls) < 2:
+            raise ServiceError(422, "At least 2 video URLs are required for merging")
+
+        # Create temporary directory for processing
+        with tempfile.TemporaryDirectory() as temp_dir:
+            video_paths = [
+                os.path.join(temp_dir, f"video_{i}.mp4") for i in range(len(video_urls))
+            ]
+
+            # Download every video at once; total time is the slowest download, not the sum
+            async with _download_client() as client:
+                results = await asyncio.gather(
+                    *[
+                        _download(client, url, path)
+                        for url, path in zip(video_urls, video_paths)
+                    ],
+                    return_exceptions=True,
+                )
+
+            _raise_download_error(results)
+
+            return await asyncio.get_running_loop().run_in_executor(
+                RENDER_POOL, _render, video_paths
+            )
+
+    @staticmethod
+    async def merge_video_stream(videos: AsyncIterator[Tuple[int, str]]) -> Dict[str, str]:
+        """
+        Merge videos whose URLs arrive one at a time.
 
+        Each download starts as soon as its URL arrives, so fetching the early
+        clips overlaps with the caller still producing the later ones. Once the
+        iterator is exhausted the videos are merged in index order, exactly as
+        merge_videos would.
+
+        Args:
+            videos: (index, video URL) pairs in any order; indexes must cover 0..N-1
+
+        Returns:
+            Same shape as merge_videos
+
+        Raises:
+            ServiceError: As merge_videos, plus 422 for repeated or missing indexes;
+                errors raised by the iterator propagate unchanged
+        """
+        downloads: Dict[int, asyncio.Task] = {}
+        # Create temporary directory for processing
+        with tempfile.TemporaryDirectory() as temp_dir:
+            async with _download_client() as client:
                 try:
-                    # Concatenate all video clips
-                    merged_clip = concatenate_videoclips(video_clips)
+                    async for index, url in videos:
+                        if index in downloads:
+                            raise ServiceError(422, f"Video {index + 1} was sent more than once")
+                        path = os.path.join(temp_dir, f"video_{index}.mp4")
+                        downloads[index] = asyncio.create_task(_download(client, url, path))
 
-                    # Save merged video to project directory
-                    output_dir = os.path.dirname(
-                        os.path.dirname(os.path.dirname(__file__))
-                    )
-                    merged_video_path = os.path.join(output_dir, "merged_video.mp4")
-
-                    merged_clip.write_videofile(
-                        merged_video_path,
-                        codec="libx264",
-                        audio_codec="aac",
-                        temp_audiofile="temp-audio.m4a",
-                        remove_temp=True,
+                    # Validate input
+                    if len(downloads) < 2:
+                        raise ServiceError(422, "At least 2 video URLs are required for merging")
+                    if sorted(downloads) != list(range(len(downloads))):
+                        raise ServiceError(
+                            422,
+                            "Video indexes must run from 0 to one less than the number of videos",
+                        )
+
+                    results = await asyncio.gather(
+                        *[downloads[i] for i in range(len(downloads))],
+                        return_exceptions=True,
                     )
+                finally:
+                    # A rejected item or a broken request body must not leave
+                    # downloads writing into the temp dir after it is removed
+                    for task in downloads.values():
+                        task.cancel()
+                    await asyncio.gather(*downloads.values(), return_exceptions=True)
+
+            _raise_download_error(results)
 
-                    # Close all clips to free memory
-                    merged_clip.close()
-                    for clip in video_clips:
-                        clip.close()
-
-                    return {
-                        "status": "success",
-                        "message": f"Successfully merged {len(video_urls)} videos",
-                        "merged_video_path": merged_video_path,
-                        "merged_video_url": f"file://{merged_video_path}",
-                    }
-
-                except Exception as e:
-                    # Clean up clips on error
-                    for clip in video_clips:
-                        clip.close()
-                    return {
-                        "status": "error",
-                        "message": f"Failed to merge videos: {str(e)}",
-                    }
-
-        except Exception as e:
-            return {
-                "status": "error",
-                "message": f"Failed to merge videos: {str(e)}",
-            }
+            video_paths = [
+                os.path.join(temp_dir, f"video_{i}.mp4") for i in range(len(downloads))
+            ]
+            return await asyncio.get_running_loop().run_in_executor(
+                RENDER_POOL, _render, video_paths
+            )
@@ -5,20 +5,108 @@ This service uses Gemini 2.5 Flash to create detailed prompts for the
 ByteDance Seedance-1-pro model to generate stable, high-quality videos.
 """
 
-import replicate  # pyright: ignore[reportMissingImports]
-import os
-from typing import Dict
-from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
+import asyncio
+import re
+from typing import Dict, Optional
+from ._replicate import stream
+from . import _cache as prompt_cache
+from ._output import strip_fence
+from ._semantic_cache import SemanticCache
+from .errors import ServiceError
+
+# Bump when the prompt template changes so stale prompts are not reused
+_TEMPLATE_ID = "video-prompt-v3"
+
+# Static instructions sent as the Gemini system instruction. They follow specific
+# rules for stable video generation with character positioning analysis. Keep this
+# text byte-identical between calls and keep the scene description out of it, so
+# repeated requests share a cacheable prefix and only pay for the dynamic tail.
+SYSTEM_PREFIX = """\
+Analyze the scene description that follows and create a video generation prompt for a high-quality AI video model.
+
+First, analyze where the character is positioned and what they are doing initially in the scene. Then create a video generation prompt that starts from that position and describes the sequence of actions that follow, following these essential guidelines:
+
+CRITICAL REQUIREMENTS FOR STABLE VIDEO GENERATION:
+
+1. FOCUS ON TRANSFORMATION: Describe only the sequence of events that logically connects the start to the end. Answer: "What physically happens to get from the first frame to the final frame?"
+
+2. USE VERB-CENTRIC DECLARATIVE SENTENCES: Structure your entire prompt as a sequence of short, simple, declarative sentences. Each sentence should be a clear Subject-Verb-Object instruction.
+- CORRECT STYLE: "The woman raises her arm. A ball of light appears. The light grows brighter."
+- INCORRECT STYLE: "As the woman raises her arm, a ball of light appears and grows brighter."
+
+3. AVOID COMPLEXITY:
+- NO compound sentences (no 'and', 'but', 'while' connecting actions)
+- NO subordinate or dependent clauses
+- NO metaphors, poetry, or abstract concepts
+
+4. ONE SINGLE, COHERENT EVENT: Describe one continuous action from start to finish. Do not introduce new subjects, conflicting actions, or scene cuts.
+
+5. MANAGE LENGTH: Keep the final prompt between 60 and 120 words. Provide enough detail without overwhelming the model.
+
+Requirements for the video prompt:
+- Start from the character's current position (don't mention the initial position)
+- Focus on physical transformations and movements that follow
+- Use simple, declarative sentence structure
+- Describe one continuous, logical sequence
+- Avoid complex grammar or abstract concepts
+- Keep it concise but descriptive
+- Ensure smooth, stable video generation
+
+Return ONLY the detailed video generation prompt, no additional text or formatting.
+"""
+
+# Per-request tail appended after SYSTEM_PREFIX; only the scene description varies
+_VIDEO_PROMPT_TMPL = "Scene Description: {scene_description}\n"
+
+# Anything shorter can't describe a scene; don't spend a Gemini call on it
+MIN_SCENE_DESCRIPTION_LENGTH = 10
+
+# Paraphrased scene descriptions reuse a previously generated video prompt
+_SEMANTIC_CACHE = SemanticCache("video_prompt", threshold=0.87)
+
+# Sentence-by-sentence rewordings: if every sentence closely matches the same scene
+# we already have a prompt for, reuse that prompt instead of asking Gemini again
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_FRAGMENT_THRESHOLD = 0.75  # Minimum similarity for a single sentence to count as a hit
+_COMPOSED_THRESHOLD = 1.4  # Minimum summed similarity across all sentences
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
 
-# Load environment variables from .env file
-load_dotenv()
+async def _compose_from_fragments(scene_description: str) -> Optional[Dict[str, str]]:
+    """Reuse the cached prompt every sentence maps to, or None if any sentence is new."""
+    fragments = [f for f in _SENTENCE_SPLIT.split(scene_description.strip()) if f]
+    if len(fragments) < 2:  # A single sentence is already covered by the plain semantic lookup
+        return None
+
+    matches = await asyncio.gather(*[_SEMANTIC_CACHE.nearest(f) for f in fragments])
+    # Every sentence must be covered, otherwise part of the scene would be dropped
+    if any(match is None or match[0] < _FRAGMENT_THRESHOLD for match in matches):
+        return None
+    if sum(similarity for similarity, _ in matches) < _COMPOSED_THRESHOLD:
+        return None
+
+    # Sentences hitting different scenes make a multi-event description. Whole
+    # prompts can't be stitched for it: each is already a full 60-120 word shot, so
+    # the join would break the length cap and describe several shots at once
+    prompts = {entry["prompt"] for _, entry in matches}
+    if len(prompts) > 1:
+        return None
+
+    return {
+        "status": "success",
+        "message": "Video prompt composed from cached scenes",
+        "prompt": prompts.pop(),
+    }
 
 
 class VideoPromptService:
     """Service for video prompt operations using AI-generated content."""
 
     @staticmethod
-    def create_video_prompt(scene_description: str) -> Dict[str, str]:
+    async def create_video_prompt(scene_description: str) -> Dict[str, str]:
         """
         Create a detailed video prompt using Gemini 2.5 Flash.
 
@@ -30,101 +118,89 @@ class VideoPromptService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - prompt: Generated video generation prompt (if successful)
-                - raw_output: Raw AI response (if error)
+                - prompt: Generated video generation prompt
+
+        Raises:
+            ServiceError: 422 if the scene description is too short, 502 if the
+                generated prompt is too short
         """
-        try:  # Start try block to catch any exceptions during prompt generation
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-            # Create a detailed prompt for Gemini to analyze the scene and create video generation instructions
-            # This prompt follows specific rules for stable video generation with character positioning analysis
-            prompt = f"""
-            Analyze this scene description and create a video generation prompt for a high-quality AI video model.
-            
-            Scene Description: {scene_description}
-            
-            First, analyze where the character is positioned and what they are doing initially in the scene. Then create a video generation prompt that starts from that position and describes the sequence of actions that follow, following these essential guidelines:
-            
-            CRITICAL REQUIREMENTS FOR STABLE VIDEO GENERATION:
-            
-            1. FOCUS ON TRANSFORMATION: Describe only the sequence of events that logically connects the start to the end. Answer: "What physically happens to get from the first frame to the final frame?"
-            
-            2. USE VERB-CENTRIC DECLARATIVE SENTENCES: Structure your entire prompt as a sequence of short, simple, declarative sentences. Each sentence should be a clear Subject-Verb-Object instruction.
-            - CORRECT STYLE: "The woman raises her arm. A ball of light appears. The light grows brighter."
-            - INCORRECT STYLE: "As the woman raises her arm, a ball of light appears and grows brighter."
-            
-            3. AVOID COMPLEXITY:
-            - NO compound sentences (no 'and', 'but', 'while' connecting actions)
-            - NO subordinate or dependent clauses
-            - NO metaphors, poetry, or abstract concepts
-            
-            4. ONE SINGLE, COHERENT EVENT: Describe one continuous action from start to finish. Do not introduce new subjects, conflicting actions, or scene cuts.
-            
-            5. MANAGE LENGTH: Keep the final prompt between 60 and 120 words. Provide enough detail without overwhelming the model.
-            
-            Requirements for the video prompt:
-            - Start from the character's current position (don't mention the initial position)
-            - Focus on physical transformations and movements that follow
-            - Use simple, declarative sentence structure
-            - Describe one continuous, logical sequence
-            - Avoid complex grammar or abstract concepts
-            - Keep it concise but descriptive
-            - Ensure smooth, stable video generation
-            
-            Return ONLY the detailed video generation prompt, no additional text or formatting.
-            """
-
-            # Call the Gemini 2.5 Flash model through Replicate API
-            # This sends our prompt to the AI model and gets back a streaming response
-            output = replicate.run(
-                "google/gemini-2.5-flash",  # Specify the exact model to use
-                input={  # Pass parameters to control the AI's behavior
-                    "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
-                    "prompt": prompt,  # The detailed prompt we created above
-                    "temperature": 0.6,  # Lower temperature for more focused, rule-following output
-                    "dynamic_thinking": False,  # Disable for faster response
-                    "max_output_tokens": 1000,  # Sufficient for concise video prompts
-                },
+        # Preflight: reject empty or trivial input before any cache or Replicate work,
+        # and drop surrounding whitespace that would only add prompt tokens
+        scene_description = scene_description.strip() if scene_description else ""
+        if len(scene_description) < MIN_SCENE_DESCRIPTION_LENGTH:
+            raise ServiceError(
+                422, "Scene description is too short. Please provide more detail."
             )
 
-            # Initialize empty string to collect the AI's response
-            # Replicate returns an iterator that streams the response in chunks
-            generated_content = ""
-            # Loop through each chunk of the streaming response
-            for item in output:
-                # Convert each chunk to string and append to our content string
-                generated_content += str(item)
-
-            # Clean any markdown formatting that AI models might add
-            # Remove code block markers that could interfere with the prompt
-            if generated_content.startswith("```"):  # Check for markdown code blocks
-                # Remove ``` markers and strip whitespace
-                generated_content = generated_content.replace("```", "").strip()
-
-            # Validate that we have meaningful content
-            if len(generated_content.strip()) < 10:  # Check if response is too short
-                return {
-                    "status": "error",
-                    "message": "Generated prompt is too short. Please try again.",
-                    "raw_output": generated_content,
-                }
-
-            # Return successful response with the generated prompt
-            return {
-                "status": "success",  # Indicate successful generation
-                "message": "Video prompt created successfully",  # Success message
-                "prompt": generated_content.strip(),  # The actual video generation prompt
-            }
-
-        except (
-            Exception
-        ) as e:  # Catch any unexpected errors (API failures, network issues)
-            # Return generic error response for any other exceptions
-            return {
-                "status": "error",
-                "message": f"Failed to generate video prompt: {str(e)}",  # Include error details
-            }
+        # Exact hit: same template and scene description
+        cache_key = prompt_cache.make_key(
+            "video_prompt", _TEMPLATE_ID, _normalize(scene_description)
+        )
+        cached = await prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Semantic hit: a reworded but equivalent scene description
+        hit = await _SEMANTIC_CACHE.lookup(scene_description)
+        if hit is not None:
+            return hit
+
+        # Fragment hit: every sentence rewords the same scene we have already seen
+        composed = await _compose_from_fragments(scene_description)
+        if composed is not None:
+            # Remember it for exact hits only; indexing it semantically would add a
+            # second vector for a prompt that was never generated for this text
+            await prompt_cache.put(cache_key, composed, prompt_cache.PROMPT_CACHE_TTL)
+            return composed
+
+        # Only the scene description goes in the prompt; it must stay at the tail,
+        # after the static SYSTEM_PREFIX, or provider prompt caching stops hitting
+        prompt = _VIDEO_PROMPT_TMPL.format(scene_description=scene_description)
+
+        # Call the Gemini 2.5 Flash model through Replicate API
+        # This sends our prompt to the AI model and gets back a streaming response
+        output = stream(
+            "google/gemini-2.5-flash",  # Specify the exact model to use
+            input={  # Pass parameters to control the AI's behavior
+                "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
+                "prompt": prompt,  # The scene description we created above
+                "system_instruction": SYSTEM_PREFIX,  # Static, cacheable instructions
+                "temperature": 0.6,  # Lower temperature for more focused, rule-following output
+                "dynamic_thinking": False,  # Disable for faster response
+                "max_output_tokens": 400,  # 120-word cap with headroom; a smaller budget decodes faster
+            },
+        )
+
+        # Collect the AI's response chunks in a list and join once at the end
+        # Replicate returns an iterator that streams the response in chunks
+        parts = []
+        # Loop through each chunk of the streaming response
+        async for item in output:
+            # Stream events render to their text; plain strings are kept as-is
+            parts.append(item if isinstance(item, str) else str(item))
+        generated_content = "".join(parts)
+
+        # Clean any markdown formatting that AI models might add
+        # Remove code block markers that could interfere with the prompt
+        generated_content = strip_fence(generated_content)
+
+        # Validate that we have meaningful content
+        if len(generated_content.strip()) < 10:  # Check if response is too short
+            raise ServiceError(
+                502,
+                "Generated prompt is too short. Please try again.",
+                raw_output=generated_content,
+            )
+
+        # Build successful response with the generated prompt
+        result = {
+            "status": "success",  # Indicate successful generation
+            "message": "Video prompt created successfully",  # Success message
+            "prompt": generated_content.strip(),  # The actual video generation prompt
+        }
+
+        await prompt_cache.put(cache_key, result, prompt_cache.PROMPT_CACHE_TTL)
+        await _SEMANTIC_CACHE.add(scene_description, result)
+        return result
@@ -5,20 +5,62 @@ This service uses Gemini 2.5 Flash to expand setting descriptions into detailed
 prompts for the Minimax image-01 model to generate high-quality setting images.
 """
 
-import replicate
-import os
 from typing import Dict
-from dotenv import load_dotenv
+from ._replicate import stream
+from . import _cache as prompt_cache
+from ._output import strip_fence
+from .errors import ServiceError
+
+# Bump when the prompt template changes so stale expansions are not reused
+_TEMPLATE_ID = "setting-prompt-v2"
+
+# Static instructions sent as the Gemini system instruction. Keep this text
+# byte-identical between calls and keep the description out of it, so repeated
+# requests share a cacheable prefix and only pay for the short dynamic tail.
+SYSTEM_PREFIX = """\
+Expand the setting description that follows into a detailed image generation prompt for a high-quality AI image model.
+
+Create a comprehensive prompt that includes:
+- Detailed scene description (location, environment, architecture)
+- Lighting conditions (natural, artificial, time of day, mood)
+- Atmospheric elements (weather, fog, dust, particles)
+- Objects and their specific placements in the scene
+- Cinematic composition and framing
+- Color palette and visual style
+- Depth and perspective details
+- Environmental textures and materials
+
+Requirements for the image:
+- Cinematic style with professional photography quality
+- High resolution and detailed rendering
+- Proper lighting and atmospheric effects
+- Clear object placement and spatial relationships
+- Dramatic or moody atmosphere appropriate to the setting
+- Use specific, descriptive language for AI image generation
+- Focus on visual storytelling and scene composition
+
+IMPORTANT: Keep the final prompt under 250 words. Be concise but descriptive.
+
+Return ONLY the detailed image generation prompt, no additional text or formatting.
+"""
+
+# Per-request tail appended after SYSTEM_PREFIX; only the description varies
+_SETTING_PROMPT_TMPL = "Setting Description: {description}\n"
+
+# The prompt is asked to stay under 250 words (~2 KB); anything past this is a
+# runaway generation and is abandoned instead of being buffered without bound
+MAX_RESPONSE_CHARS = 32 * 1024
 
-# Load environment variables from .env file
-load_dotenv()
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
 
 
 class SettingPromptService:
     """Service for setting prompt operations using AI-generated content."""
 
     @staticmethod
-    def create_setting_prompt(description: str) -> Dict[str, str]:
+    async def create_setting_prompt(description: str) -> Dict[str, str]:
         """
         Create a detailed setting prompt using Gemini 2.5 Flash.
 
@@ -30,94 +72,85 @@ class SettingPromptService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - prompt: Generated image generation prompt (if successful)
-                - raw_output: Raw AI response (if error)
+                - prompt: Generated image generation prompt
+
+        Raises:
+            ServiceError: If the response runs past MAX_RESPONSE_CHARS or is too short to use
         """
-        try:  # Start try block to catch any exceptions during prompt generation
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-            # Create a detailed prompt for Gemini to expand the setting description
-            # This prompt ensures specific formatting for cinematic setting image generation
-            prompt = f"""
-            Expand this setting description into a detailed image generation prompt for a high-quality AI image model.
-            
-            Setting Description: {description}
-            
-            Create a comprehensive prompt that includes:
-            - Detailed scene description (location, environment, architecture)
-            - Lighting conditions (natural, artificial, time of day, mood)
-            - Atmospheric elements (weather, fog, dust, particles)
-            - Objects and their specific placements in the scene
-            - Cinematic composition and framing
-            - Color palette and visual style
-            - Depth and perspective details
-            - Environmental textures and materials
-            
-            Requirements for the image:
-            - Cinematic style with professional photography quality
-            - High resolution and detailed rendering
-            - Proper lighting and atmospheric effects
-            - Clear object placement and spatial relationships
-            - Dramatic or moody atmosphere appropriate to the setting
-            - Use specific, descriptive language for AI image generation
-            - Focus on visual storytelling and scene composition
-            
-            IMPORTANT: Keep the final prompt under 250 words. Be concise but descriptive.
-            
-            Return ONLY the detailed image generation prompt, no additional text or formatting.
-            """
-
-            # Call the Gemini 2.5 Flash model through Replicate API
-            # This sends our prompt to the AI model and gets back a streaming response
-            output = replicate.run(
-                "google/gemini-2.5-flash",  # Specify the exact model to use
-                input={  # Pass parameters to control the AI's behavior
-                    "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
-                    "prompt": prompt,  # The detailed prompt we created above
-                    "temperature": 0.8,  # Higher creativity for detailed descriptions
-                    "dynamic_thinking": False,  # Disable for faster response
-                    "max_output_tokens": 2000,  # Sufficient for detailed prompt generation
-                },
+        # Exact hit: same template and setting description
+        cache_key = prompt_cache.make_key(
+            "setting_prompt", _TEMPLATE_ID, _normalize(description)
+        )
+        cached = await prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Only the description goes in the prompt; it must stay at the tail,
+        # after the static SYSTEM_PREFIX, or provider prompt caching stops hitting
+        prompt = _SETTING_PROMPT_TMPL.format(description=description)
+
+        # Call the Gemini 2.5 Flash model through Replicate API
+        # This sends our prompt to the AI model and gets back a streaming response
+        output = stream(
+            "google/gemini-2.5-flash",  # Specify the exact model to use
+            input={  # Pass parameters to control the AI's behavior
+                "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
+                "prompt": prompt,  # The setting description we created above
+                "system_instruction": SYSTEM_PREFIX,  # Static, cacheable instructions
+                "temperature": 0.8,  # Higher creativity for detailed descriptions
+                "dynamic_thinking": False,  # Disable for faster response
+                "max_output_tokens": 2000,  # Sufficient for detailed prompt generation
+            },
+        )
+
+        # Collect the AI's response chunks in a list and join once at the end
+        # Replicate returns an iterator that streams the response in chunks
+        parts = []
+        size = 0
+        try:
+            # Loop through each chunk of the streaming response
+            async for item in output:
+                # Stream events render to their text; plain strings are kept as-is
+                text = item if isinstance(item, str) else str(item)
+                size += len(text)
+                if size > MAX_RESPONSE_CHARS:
+                    break
+                parts.append(text)
+        finally:
+            # Stop the rest of the stream after an overflow or an error, rather than
+            # let it drain in the background
+            aclose = getattr(output, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        generated_content = "".join(parts)
+
+        if size > MAX_RESPONSE_CHARS:
+            raise ServiceError(
+                502,
+                f"Response exceeded {MAX_RESPONSE_CHARS} characters. Please try again.",
+                raw_output=generated_content,
             )
 
-            # Initialize empty string to collect the AI's response
-            # Replicate returns an iterator that streams the response in chunks
-            generated_content = ""
-            # Loop through each chunk of the streaming response
-            for item in output:
-                # Convert each chunk to string and append to our content string
-                generated_content += str(item)
-
-            # Clean any markdown formatting that AI models might add
-            # Remove code block markers that could interfere with the prompt
-            if generated_content.startswith("```"):  # Check for markdown code blocks
-                # Remove ``` markers and strip whitespace
-                generated_content = generated_content.replace("```", "").strip()
-
-            # Validate that we have meaningful content
-            if len(generated_content.strip()) < 50:  # Check if response is too short
-                return {
-                    "status": "error",
-                    "message": "Generated prompt is too short. Please try again.",
-                    "raw_output": generated_content,
-                }
-
-            # Return successful response with the generated prompt
-            return {
-                "status": "success",  # Indicate successful generation
-                "message": "Setting prompt created successfully",  # Success message
-                "prompt": generated_content.strip(),  # The actual image generation prompt
-            }
-
-        except (
-            Exception
-        ) as e:  # Catch any unexpected errors (API failures, network issues)
-            # Return generic error response for any other exceptions
-            return {
-                "status": "error",
-                "message": f"Failed to generate setting prompt: {str(e)}",  # Include error details
-            }
+        # Clean any markdown formatting that AI models might add
+        # Remove code block markers that could interfere with the prompt
+        generated_content = strip_fence(generated_content)
+
+        # Validate that we have meaningful content
+        if len(generated_content.strip()) < 50:  # Check if response is too short
+            raise ServiceError(
+                502,
+                "Generated prompt is too short. Please try again.",
+                raw_output=generated_content,
+            )
+
+        # Build successful response with the generated prompt
+        result = {
+            "status": "success",  # Indicate successful generation
+            "message": "Setting prompt created successfully",  # Success message
+            "prompt": generated_content.strip(),  # The actual image generation prompt
+        }
+
+        await prompt_cache.put(cache_key, result, prompt_cache.PROMPT_CACHE_TTL)
+        return result
@@ -6,22 +6,145 @@ with 12 scenes, each featuring one character. The service handles JSON parsing,
 and error recovery for truncated responses.
 """
 
-import os
 import json
-import replicate  # pyright: ignore[reportMissingImports]
+import re
 import contextlib
-from typing import Dict, Any
-from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
+from typing import Dict, Any, Optional
 
-# Load environment variables from .env file
-load_dotenv()
+import orjson
+
+from ._replicate import stream
+from . import _cache as prompt_cache
+from ._output import strip_fence
+from .errors import ServiceError
+
+# Bump when the prompt template changes so stale storyboards are not reused
+_TEMPLATE_ID = "storyboard-v2"
+
+# Static instructions sent as the Gemini system instruction. Keep this text
+# byte-identical between calls and keep the idea out of it, so repeated requests
+# share a cacheable prefix and only pay for the short dynamic tail.
+SYSTEM_PREFIX = """\
+Create a 60-second video script based on the idea that follows.
+
+Generate a JSON response with exactly this structure:
+{
+    "characters": [
+        {
+            "name": "Character's real name (e.g., Sarah, Emma, Michael)",
+            "description": "Detailed description including age, basic appearance, relation to other characters, etc."
+        }
+    ],
+    "sound_effect": "One word describing the ambient sound for the entire video (e.g., rain, traffic, wind, ocean, birds, silence, footsteps, typing, cooking, etc.)",
+    "scenes": [
+        {
+            "scene_number": "Sequential scene number",
+            "setting": "Detailed description of location, time, atmosphere, lighting, and visual elements (ONLY for scene 1, leave empty for scenes 2-12)",
+            "description": "2-3 sentences about key events and character interactions, with explicit mention of the person's position and action using generic references like 'the person' or 'the character'"
+        }
+    ]
+}
+
+Requirements:
+- Create exactly 12 scenes, no more, no less
+- Use exactly one single character for the entire storyboard (the same character appears in all scenes)
+- Each scene should be approximately 5 seconds long (60 seconds total)
+- Use realistic character names
+- Choose ONE appropriate sound effect word that matches the story's setting and mood (e.g., "rain" for storm scenes, "traffic" for city scenes, "wind" for outdoor scenes, "silence" for quiet indoor scenes)
+- Scene 1: Provide detailed setting description (location, time, atmosphere, lighting, visual elements)
+- Scenes 2-12: Leave setting field empty or use "Continuing from previous scene" - these will use video frame extraction for continuity
+- Scene descriptions must follow Seedance-1-pro video generation guidelines for optimal results
+- Use verb-centric declarative sentences with generic character references (e.g., "The person wakes up. The person stretches arms. The person sits upright.")
+- NO compound sentences (no 'and', 'but', 'while' connecting actions)
+- NO subordinate or dependent clauses
+- Focus on physical transformations and movements that are visually clear
+- Limit actions to 2-3 per scene maximum - no more than 2-3 actions should be in a scene
+- Each action should be a simple, declarative sentence
+- Actions should be essential movements that can be completed in 5 seconds
+- End each scene with a clear, stable pose for better frame extraction
+- Avoid complex emotional descriptions - focus on physical actions only
+- Ensure each scene ends with a pose that can be easily extracted as a frame
+- Ensure strict continuity: each scene must be a direct continuation and extended version of the previous scene's moment (no jumps, no resets, no new subjects)
+- Ensure the story progresses smoothly and logically across all 12 scenes
+- Return ONLY the JSON, no additional text
+"""
+
+# Per-request tail appended after SYSTEM_PREFIX; only the idea varies
+_STORYBOARD_PROMPT_TMPL = 'Idea: "{idea}"\n'
+
+# A 12-scene storyboard is ~10-20 KB; anything past this is a runaway generation
+# and is abandoned instead of being buffered without bound
+MAX_RESPONSE_CHARS = 256 * 1024
+
+
+# The only characters that change brace depth or string state in JSON
+_JSON_STRUCTURE_RE = re.compile(r'[{}"\\]')
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class _ObjectEndScanner:
+    """Follow brace depth across streamed chunks to spot where each top-level JSON object closes."""
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False  # The previous chunk ended on a backslash inside a string
+        self._consumed = 0  # Length of the chunks already fed in full
+        self.start = -1  # Offset in the whole stream of the current object's opening brace
+
+    def feed(self, chunk: str, pos: int = 0) -> Optional[int]:
+        """
+        Scan chunk from pos and return the offset just past the next top-level
+        closing brace, or None once the chunk is used up. After a hit, call again
+        with that offset to keep scanning the rest of the same chunk.
+        """
+        skip = pos if self._escaped else -1  # Offset of a character escaped by a backslash
+        self._escaped = False
+        for match in _JSON_STRUCTURE_RE.finditer(chunk, pos):
+            i = match.start()
+            if i == skip:
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == "\\":
+                    if i + 1 == len(chunk):
+                        self._escaped = True
+                    else:
+                        skip = i + 1
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Quotes in any chatter before the object don't open a JSON string
+                self._in_string = self._depth > 0
+            elif char == "{":
+                if self._depth == 0:
+                    self.start = self._consumed + i
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    return i + 1
+        self._consumed += len(chunk)
+        return None
+
+
+def _decode_object(text: str) -> Optional[Dict[str, Any]]:
+    """Parse text as a JSON object, or return None if it is not one."""
+    try:
+        data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
 
 
 class StoryboardService:
     """Service for storyboard operations using AI-generated content."""
 
     @staticmethod
-    def create_storyboard(idea: str) -> Dict[str, Any]:
+    async def create_storyboard(idea: str) -> Dict[str, Any]:
         """
         Create a storyboard using Gemini 2.5 Flash via Replicate.
 
@@ -36,191 +159,162 @@ class StoryboardService:
 
         Returns:
             Dict containing:
-                - status: "success" or "error"
+                - status: "success"
                 - message: Description of the result
-                - data: Generated storyboard JSON (if successful)
-                - raw_output: Raw AI response (if error)
+                - data: Generated storyboard JSON
+
+        Raises:
+            ServiceError: If the response runs past MAX_RESPONSE_CHARS, is not valid
+                JSON, or is not a complete 12-scene storyboard
         """
-        try:  # Start try block to catch any exceptions during storyboard generation
-            # Initialize Replicate client with API token from environment variables
-            # This sets up the connection to Replicate's API using the token from .env file
-            replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-            # Create a detailed prompt string for the AI model using f-string formatting
-            # The prompt includes the user's idea and specific instructions for JSON structure
-            prompt = f"""
-            Create a 60-second video script based on this idea: "{idea}"
-            
-            Generate a JSON response with exactly this structure:
-            {{
-                "characters": [
-                    {{
-                        "name": "Character's real name (e.g., Sarah, Emma, Michael)",
-                        "description": "Detailed description including age, basic appearance, relation to other characters, etc."
-                    }}
-                ],
-                "sound_effect": "One word describing the ambient sound for the entire video (e.g., rain, traffic, wind, ocean, birds, silence, footsteps, typing, cooking, etc.)",
-                "scenes": [
-                    {{
-                        "scene_number": "Sequential scene number",
-                        "setting": "Detailed description of location, time, atmosphere, lighting, and visual elements (ONLY for scene 1, leave empty for scenes 2-12)",
-                        "description": "2-3 sentences about key events and character interactions, with explicit mention of the person's position and action using generic references like 'the person' or 'the character'"
-                    }}
-                ]
-            }}
-            
-            Requirements:
-            - Create exactly 12 scenes, no more, no less
-            - Use exactly one single character for the entire storyboard (the same character appears in all scenes)
-            - Each scene should be approximately 5 seconds long (60 seconds total)
-            - Use realistic character names
-            - Choose ONE appropriate sound effect word that matches the story's setting and mood (e.g., "rain" for storm scenes, "traffic" for city scenes, "wind" for outdoor scenes, "silence" for quiet indoor scenes)
-            - Scene 1: Provide detailed setting description (location, time, atmosphere, lighting, visual elements)
-            - Scenes 2-12: Leave setting field empty or use "Continuing from previous scene" - these will use video frame extraction for continuity
-            - Scene descriptions must follow Seedance-1-pro video generation guidelines for optimal results
-            - Use verb-centric declarative sentences with generic character references (e.g., "The person wakes up. The person stretches arms. The person sits upright.")
-            - NO compound sentences (no 'and', 'but', 'while' connecting actions)
-            - NO subordinate or dependent clauses
-            - Focus on physical transformations and movements that are visually clear
-            - Limit actions to 2-3 per scene maximum - no more than 2-3 actions should be in a scene
-            - Each action should be a simple, declarative sentence
-            - Actions should be essential movements that can be completed in 5 seconds
-            - End each scene with a clear, stable pose for better frame extraction
-            - Avoid complex emotional descriptions - focus on physical actions only
-            - Ensure each scene ends with a pose that can be easily extracted as a frame
-            - Ensure strict continuity: each scene must be a direct continuation and extended version of the previous scene's moment (no jumps, no resets, no new subjects)
-            - Ensure the story progresses smoothly and logically across all 12 scenes
-            - Return ONLY the JSON, no additional text
-            """
-
-            output = replicate.run(
-                "google/gemini-2.5-flash",  # Specify the exact model to use
-                input={  # Pass parameters to control the AI's behavior
-                    "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
-                    "prompt": prompt,  # The detailed prompt we created above
-                    "temperature": 0.7,  # Controls randomness (0.7 = balanced creativity)
-                    "dynamic_thinking": False,  # Disable for faster response
-                    "max_output_tokens": 8000,  # Maximum tokens to generate (prevents truncation)
-                },
-            )
+        # Exact hit: the same idea gets the same storyboard back instead of paying
+        # for another full Gemini generation
+        cache_key = prompt_cache.make_key("storyboard", _TEMPLATE_ID, _normalize(idea))
+        cached = await prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Only the idea goes in the prompt; it must stay at the tail, after the
+        # static SYSTEM_PREFIX, or provider prompt caching stops hitting
+        prompt = _STORYBOARD_PROMPT_TMPL.format(idea=idea)
+
+        output = stream(
+            "google/gemini-2.5-flash",  # Specify the exact model to use
+            input={  # Pass parameters to control the AI's behavior
+                "top_p": 0.95,  # Nucleus sampling parameter (0.95 = high diversity)
+                "prompt": prompt,  # The idea we created above
+                "system_instruction": SYSTEM_PREFIX,  # Static, cacheable instructions
+                "temperature": 0.7,  # Controls randomness (0.7 = balanced creativity)
+                "dynamic_thinking": False,  # Disable for faster response
+                "max_output_tokens": 8000,  # Maximum tokens to generate (prevents truncation)
+            },
+        )
 
-            # Initialize empty string to collect the AI's response
-            # Replicate returns an iterator that streams the response in chunks
-            generated_content = ""
+        # Collect the AI's response chunks in a list and join once at the end
+        # Replicate returns an iterator that streams the response in chunks
+        parts = []
+        size = 0
+        scanner = _ObjectEndScanner()
+        storyboard_data = None
+        try:
             # Loop through each chunk of the streaming response
-            for item in output:
-                # Convert each chunk to string and append to our content string
-                generated_content += str(item)
-
-            # Check if the response starts with markdown code block markers
-            # AI models often wrap JSON in markdown formatting which breaks parsing
-            if generated_content.startswith(
-                "```json"
-            ):  # Check for JSON-specific markdown
-                # Remove the ```json marker from start and ``` from end, then strip whitespace
-                generated_content = (
-                    generated_content.replace("```json", "").replace("```", "").strip()
+            async for item in output:
+                # Stream events render to their text; plain strings are kept as-is
+                text = item if isinstance(item, str) else str(item)
+                size += len(text)
+                if size > MAX_RESPONSE_CHARS:
+                    break
+                pos = 0
+                while (end := scanner.feed(text, pos)) is not None:
+                    # A top-level object just closed. If it parses, it is the storyboard
+                    # and whatever the model adds after it is chatter, so stop waiting
+                    # for it; braces in a preamble ("Here is {the} JSON") don't parse,
+                    # so scanning carries on to the next object
+                    candidate = ("".join(parts) + text[:end])[scanner.start :]
+                    storyboard_data = _decode_object(candidate)
+                    if storyboard_data is not None:
+                        break
+                    pos = end
+                if storyboard_data is not None:
+                    parts = [candidate]
+                    break
+                parts.append(text)
+        finally:
+            # Close the stream however the loop ends, so an early exit or an error
+            # releases the connection right away
+            aclose = getattr(output, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        generated_content = "".join(parts)
+
+        if size > MAX_RESPONSE_CHARS:
+            raise ServiceError(
+                502,
+                f"Response exceeded {MAX_RESPONSE_CHARS} characters. Please try again.",
+                raw_output=generated_content,
+            )
+
+        # Check if the response starts with markdown code block markers
+        # AI models often wrap JSON in markdown formatting which breaks parsing
+        generated_content = strip_fence(generated_content)
+
+        # Start a try block to handle JSON parsing and validation
+        try:
+            if storyboard_data is None:
+                # No complete object arrived, so the output was cut short. Decode
+                # from the unfinished object's opening brace; the truncation (e.g.
+                # an unclosed string) raises JSONDecodeError into the recovery path
+                start = scanner.start if scanner.start >= 0 else generated_content.find("{")
+                storyboard_data = orjson.loads(generated_content[max(start, 0) :])
+
+            # Validate that the JSON contains required top-level keys
+            # Check if "characters", "scenes", and "sound_effect" keys exist in the response
+            if (
+                "characters" not in storyboard_data  # Check for characters key
+                or "scenes" not in storyboard_data  # Check for scenes key
+                or "sound_effect" not in storyboard_data  # Check for sound_effect key
+            ):
+                # Raise ValueError if required structure is missing
+                raise ValueError("Invalid storyboard structure")
+
+            # Validate that we have exactly 12 scenes as required
+            # Count the number of scenes in the scenes array
+            if len(storyboard_data["scenes"]) != 12:  # Check scene count
+                # Raise ValueError with specific count information
+                raise ValueError(
+                    f"Expected 12 scenes, got {len(storyboard_data['scenes'])}"
                 )
-            elif generated_content.startswith("```"):  # Check for generic markdown
-                # Remove generic ``` markers and strip whitespace
-                generated_content = generated_content.replace("```", "").strip()
-
-            # Start a try block to handle JSON parsing and validation
-            try:
-                # Check if the response appears to be truncated by counting quotes
-                # Valid JSON should have an even number of quotes (opening and closing)
-                if (
-                    generated_content.count('"') % 2 != 0
-                ):  # If odd number of quotes, likely truncated
-                    # Return error response with truncated content for debugging
-                    return {
-                        "status": "error",
-                        "message": "Response appears to be truncated. Please try again.",
-                        "raw_output": generated_content,
-                    }
-
-                # Parse the cleaned content as JSON
-                # This will raise JSONDecodeError if the content is not valid JSON
-                storyboard_data = json.loads(generated_content)
-
-                # Validate that the JSON contains required top-level keys
-                # Check if "characters", "scenes", and "sound_effect" keys exist in the response
-                if (
-                    "characters" not in storyboard_data  # Check for characters key
-                    or "scenes" not in storyboard_data  # Check for scenes key
-                    or "sound_effect" not in storyboard_data  # Check for sound_effect key
-                ):
-                    # Raise ValueError if required structure is missing
-                    raise ValueError("Invalid storyboard structure")
-
-                # Validate that we have exactly 12 scenes as required
-                # Count the number of scenes in the scenes array
-                if len(storyboard_data["scenes"]) != 12:  # Check scene count
-                    # Raise ValueError with specific count information
-                    raise ValueError(
-                        f"Expected 12 scenes, got {len(storyboard_data['scenes'])}"
-                    )
-
-                # Return successful response with the validated storyboard data
-                return {
-                    "status": "success",  # Indicate successful generation
-                    "message": "Storyboard created successfully",  # Success message
-                    "data": storyboard_data,  # The actual storyboard JSON data
-                }
-
-            except json.JSONDecodeError as e:  # Catch JSON parsing errors
-                # Attempt to recover from truncated JSON by cleaning incomplete content
-                # Use contextlib.suppress to ignore any exceptions during recovery
-                with contextlib.suppress(
-                    Exception
-                ):  # Suppress any exceptions in recovery block
-                    # Check if response ends with incomplete string (not properly closed)
-                    if generated_content.endswith(  # Check if ends with quote
-                        '"'
-                    ) and not generated_content.endswith(
-                        '"}'
-                    ):  # But not with proper JSON closing
-                        # Find the last complete JSON object by finding the last closing brace
-                        last_complete_brace = generated_content.rfind(
-                            "}"
-                        )  # Find last }
-                        if last_complete_brace > 0:  # If we found a closing brace
-                            # Truncate content to the last complete object
-                            generated_content = generated_content[
-                                : last_complete_brace
-                                + 1  # Include the closing brace
-                            ]
+
+            # Build successful response with the validated storyboard data
+            result = {
+                "status": "success",  # Indicate successful generation
+                "message": "Storyboard created successfully",  # Success message
+                "data": storyboard_data,  # The actual storyboard JSON data
+            }
+
+            await prompt_cache.put(cache_key, result, prompt_cache.PROMPT_CACHE_TTL)
+            return result
+
+        except json.JSONDecodeError as e:  # Catch JSON parsing errors
+            # Attempt to recover from truncated JSON by cleaning incomplete content
+            # Use contextlib.suppress to ignore any exceptions during recovery
+            with contextlib.suppress(
+                Exception
+            ):  # Suppress any exceptions in recovery block
+                # Check if response ends with incomplete string (not properly closed)
+                if generated_content.endswith(  # Check if ends with quote
+                    '"'
+                ) and not generated_content.endswith(
+                    '"}'
+                ):  # But not with proper JSON closing
+                    # Find the last complete JSON object by finding the last closing brace
+                    last_complete_brace = generated_content.rfind(
+                        "}"
+                    )  # Find last }
+                    if last_complete_brace > 0:  # If we found a closing brace
+                        # Truncate content to the last complete object
+                        generated_content = generated_content[
+                            : last_complete_brace
+                            + 1  # Include the closing brace
+                        ]
                             
-                            storyboard_data = json.loads(generated_content)
+                        storyboard_data = orjson.loads(generated_content)
 
                             
-                            return {
-                                "status": "success",
-                                "message": "Storyboard created successfully (truncated content cleaned)",
-                                "data": storyboard_data,
-                            }
-
-                
-                return {
-                    "status": "error",
-                    "message": f"Failed to parse JSON response: {str(e)}",  
-                    "raw_output": generated_content,  
-                }
-            except (
-                ValueError
-            ) as e: 
-                
-                return {
-                    "status": "error",
-                    "message": f"Validation error: {str(e)}",  
-                    "raw_output": generated_content,  
-                }
+                        return {
+                            "status": "success",
+                            "message": "Storyboard created successfully (truncated content cleaned)",
+                            "data": storyboard_data,
+                        }
 
+            raise ServiceError(
+                502,
+                f"Failed to parse JSON response: {str(e)}",
+                raw_output=generated_content,
+            )
         except (
-            Exception
-        ) as e: 
-            
-            return {
-                "status": "error",
-                "message": f"Failed to generate storyboard: {str(e)}", 
-            }
+            ValueError
+        ) as e:
+            raise ServiceError(
+                502, f"Validation error: {str(e)}", raw_output=generated_content
+            )
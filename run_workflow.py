@@ -3,22 +3,90 @@ Simple AI Reel Maker Workflow
 Run this script to generate a complete video from an idea.
 """
 
-import requests
+import asyncio
+import contextlib
+import logging
+import logging.handlers
+import random
+import sys
+import threading
+
+import httpx
+import orjson
 
 # API base URL
 API_URL = "http://localhost:8000"
 
+# Video generation can take minutes and the API answers only when it's done,
+# but a server that isn't listening should fail fast
+REQUEST_TIMEOUT = 300
+CONNECT_TIMEOUT = 5
+
+# Connection failures are retried inside the transport before make_request sees them
+CONNECT_RETRIES = 3
+
+# Uvicorn closes idle keep-alive connections after 5 seconds, so the warm-up
+# ping is repeated more often than that while the user is typing
+WARMUP_INTERVAL = 4
+
+# Enough keep-alive connections that concurrent calls never wait to reconnect
+MAX_CONNECTIONS = 32
+
+# Retries back off exponentially with full jitter, so the many concurrent calls
+# of one run don't retry in lockstep against a rate-limited API
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Worth retrying: rate limiting and server/upstream failures. Any other 4xx means
+# the request itself is wrong and would fail the same way again.
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+logger = logging.getLogger("reel")
+
+# Progress lines are buffered and written to stderr in batches at step and scene
+# boundaries instead of one terminal write each; warnings and errors skip the
+# buffer so failures show up immediately
+PROGRESS_BUFFER_LINES = 16
+progress = logging.handlers.MemoryHandler(
+    capacity=PROGRESS_BUFFER_LINES,
+    flushLevel=logging.WARNING,
+    target=logging.StreamHandler(sys.stderr),
+)
+
+
+def retry_delay(attempt, response=None):
+    """Seconds to wait before retry number attempt + 1."""
+    # A rate-limited server says how long to back off; believe it (within reason)
+    retry_after = response.headers.get("retry-after", "") if response is not None else ""
+    if retry_after.isdigit():
+        return min(float(retry_after), RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
 
-def make_request(endpoint, data=None, max_retries=3):
+
+async def post_json(client, url, payload):
+    """POST payload encoded with orjson, which is faster than httpx's stdlib json."""
+    return await client.post(
+        url, content=orjson.dumps(payload), headers={"Content-Type": "application/json"}
+    )
+
+
+async def make_request(client, endpoint, data=None, max_retries=5):
     """Make a simple HTTP request to the API with retry logic."""
     url = f"{API_URL}{endpoint}"
 
     for attempt in range(max_retries):
+        response = None
         try:
             if data:
-                response = requests.post(url, json=data)
+                response = await post_json(client, url, data)
             else:
-                response = requests.get(url)
+                response = await client.get(url)
+
+            if 400 <= response.status_code < 500 and response.status_code not in RETRY_STATUSES:
+                logger.error(
+                    f"   ❌ {endpoint} rejected the request ({response.status_code}): {response.text[:200]}"
+                )
+                return None
 
             result = response.json()
 
@@ -26,180 +94,332 @@ def make_request(endpoint, data=None, max_retries=3):
             if result and result.get("status") == "success":
                 return result
             elif result and result.get("status") == "error":
-                print(
-                    f"   ⚠️  API error (attempt {attempt + 1}/{max_retries}): {result.get('message', 'Unknown error')}"
+                logger.warning(
+                    f"   ⚠️  {endpoint} API error (attempt {attempt + 1}/{max_retries}): {result.get('message', 'Unknown error')}"
                 )
             else:
-                print(f"   ⚠️  Invalid response (attempt {attempt + 1}/{max_retries})")
-
-            # If not the last attempt, wait before retrying
-            if attempt < max_retries - 1:
-                print("   🔄 Retrying in 2 seconds...")
-                import time
-
-                time.sleep(2)
+                logger.warning(f"   ⚠️  {endpoint} invalid response (attempt {attempt + 1}/{max_retries})")
 
         except Exception as e:
-            print(f"   ⚠️  Request error (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                print("   🔄 Retrying in 2 seconds...")
-                import time
+            logger.warning(f"   ⚠️  {endpoint} request error (attempt {attempt + 1}/{max_retries}): {e}")
 
-                time.sleep(2)
+        # If not the last attempt, wait before retrying
+        if attempt < max_retries - 1:
+            delay = retry_delay(attempt, response)
+            logger.info(f"   🔄 Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
 
-    print(f"   ❌ Failed after {max_retries} attempts")
+    logger.error(f"   ❌ {endpoint} failed after {max_retries} attempts")
     return None
 
 
-def main():
-    print("🎬 AI Reel Maker - Simple Workflow")
-    print("=" * 40)
+async def create_character(client, character):
+    """Character prompt, then character image; returns the image URL or None."""
+    char_prompt = await make_request(
+        client,
+        "/character-prompt",
+        {"description": character["description"], "name": character["name"]},
+    )
+    if not char_prompt:
+        logger.error("❌ Failed to create character prompt")
+        return None
+
+    char_image = await make_request(
+        client, "/character-image", {"prompt": char_prompt["prompt"]}
+    )
+    if not char_image:
+        logger.error("❌ Failed to create character image")
+        return None
 
-    # Get idea from user
-    idea = input("Enter your story idea: ")
-    if not idea:
-        idea = "A woman sits at her window watching a heavy rainstorm, finding peaceful joy in the cozy warmth of her dry indoor space."
-        print(f"Using default idea: {idea}")
+    logger.info("✅ Character created")
+    return char_image["image_url"]
 
-    print(f"\n🚀 Starting workflow with idea: {idea}")
-    print("=" * 40)
+
+async def create_setting(client, scene):
+    """Setting prompt, then setting image for scene 1; returns the image URL or None."""
+    setting_prompt = await make_request(
+        client, "/setting-prompt", {"description": scene["setting"]}
+    )
+    if not setting_prompt:
+        logger.error("   ❌ Failed to create setting prompt")
+        return None
+
+    setting_img = await make_request(
+        client, "/setting-image", {"prompt": setting_prompt["prompt"]}
+    )
+    if not setting_img:
+        logger.error("   ❌ Failed to create setting image")
+        return None
+
+    logger.info("   ✅ Setting created")
+    return setting_img["image_url"]
+
+
+async def add_sound(client, i, video_url, sound_effect, merge_queue, index):
+    """Add sound effects to a scene video, falling back to the original video."""
+    video_with_sound = await make_request(
+        client,
+        "/add-sound-effect",
+        {"video_url": video_url, "sound_effect": sound_effect},
+    )
+    if video_with_sound:
+        logger.info(f"   ✅ Scene {i} sound effects added")
+        video_url = video_with_sound["video_url"]
+    else:
+        # Fallback to original video if sound effects fail
+        logger.warning(f"   ⚠️  Scene {i} sound effects failed, using original video")
+
+    # Hand the finished video to the merge right away; index is its place in the result
+    await merge_queue.put({"index": index, "video_url": video_url})
+    return video_url
+
+
+async def stream_merge(client, merge_queue):
+    """
+    POST /merge-videos/stream, sending each video as soon as it is queued.
+
+    The server starts downloading a video the moment its line arrives, so the
+    merge's downloads overlap with the remaining scenes being generated. A None
+    on the queue ends the request body. Returns the result, or None on failure.
+    """
+
+    async def body():
+        while (item := await merge_queue.get()) is not None:
+            yield orjson.dumps(item) + b"\n"
 
     try:
-        # Step 1: Generate storyboard
-        print("\n1️⃣ Generating storyboard...")
-        storyboard = make_request("/storyboard", {"idea": idea})
-        if not storyboard:
-            print("❌ Failed to generate storyboard")
-            return
-
-        scenes = storyboard["data"]["scenes"]
-        character = storyboard["data"]["characters"][0]
-        sound_effect = storyboard["data"]["sound_effect"]
-        print(f"✅ Generated {len(scenes)} scenes with sound effect: {sound_effect}")
-
-        # Step 2: Create character
-        print("\n2️⃣ Creating character...")
-        char_prompt = make_request(
-            "/character-prompt",
-            {"description": character["description"], "name": character["name"]},
+        response = await client.post(
+            f"{API_URL}/merge-videos/stream",
+            content=body(),
+            headers={"Content-Type": "application/x-ndjson"},
         )
-        if not char_prompt:
-            print("❌ Failed to create character prompt")
-            return
+        result = response.json()
+    except Exception as e:
+        logger.warning(f"   ⚠️  /merge-videos/stream request error: {e}")
+        return None
 
-        char_image = make_request("/character-image", {"prompt": char_prompt["prompt"]})
-        if not char_image:
-            print("❌ Failed to create character image")
-            return
+    if isinstance(result, dict) and result.get("status") == "success":
+        return result
+    # An API without the streaming endpoint answers 404 with no "message"
+    message = result.get("message") if isinstance(result, dict) else None
+    logger.warning(
+        f"   ⚠️  /merge-videos/stream API error: {message or f'HTTP {response.status_code}'}"
+    )
+    return None
 
-        print("✅ Character created")
 
-        # Step 3: Process scenes
-        video_urls = []
-        setting_image = None
+async def run(client, idea):
+    # Step 1: Generate storyboard
+    logger.info("\n1️⃣ Generating storyboard...")
+    storyboard = await make_request(client, "/storyboard", {"idea": idea})
+    if not storyboard:
+        logger.error("❌ Failed to generate storyboard")
+        return
 
-        for i, scene in enumerate(scenes, 1):
-            print(f"\n3️⃣ Processing Scene {i}/{len(scenes)}")
+    scenes = storyboard["data"]["scenes"]
+    character = storyboard["data"]["characters"][0]
+    sound_effect = storyboard["data"]["sound_effect"]
+    logger.info(f"✅ Generated {len(scenes)} scenes with sound effect: {sound_effect}")
+    progress.flush()
 
-            # Create setting (only for first scene)
-            if i == 1:
-                print("   Creating setting...")
-                setting_prompt = make_request(
-                    "/setting-prompt", {"description": scene["setting"]}
-                )
-                if setting_prompt:
-                    setting_img = make_request(
-                        "/setting-image", {"prompt": setting_prompt["prompt"]}
-                    )
-                    if setting_img:
-                        setting_image = setting_img["image_url"]
-                        print("   ✅ Setting created")
-                    else:
-                        print("   ❌ Failed to create setting image")
-                        continue
-                else:
-                    print("   ❌ Failed to create setting prompt")
-                    continue
-
-                # Combine character and setting (only for first scene)
-
-                print("   Combining scene...")
-                combine_prompt = make_request(
-                    "/combine-prompt", {"scene_description": scene["description"]}
-                )
-                if combine_prompt:
-                    combined = make_request(
-                        "/combine-image",
-                        {
-                            "prompt": combine_prompt["prompt"],
-                            "character_image": char_image["image_url"],
-                            "setting_image": setting_image,
-                        },
-                    )
-                    if not combined:
-                        print("   ❌ Failed to combine scene")
-                        continue
-                    initial_image = combined["image_url"]
-                    print("   ✅ Scene combined")
-                else:
-                    print("   ❌ Failed to create combination prompt")
-                    continue
-            else:
-                # For scenes 2+, extract frame from previous video
-                print("   Extracting frame from previous video...")
-                frame = make_request("/extract-frame", {"video_url": video_urls[-1]})
-                if frame:
-                    initial_image = frame["frame_url"]
-                    print("   ✅ Frame extracted")
-                else:
-                    print("   ❌ Failed to extract frame, skipping scene")
-                    continue
-
-            # Generate video
-            print("   Generating video...")
-            # video_prompt = make_request(
-            #     "/video-prompt", {"scene_description": scene["description"]}
-            # )
-            video = make_request(
-                "/generate-video",
+    # Step 2: Create character, and in parallel the scene 1 setting and combination
+    # prompt; none of them depend on each other, only the combined image needs all three
+    logger.info("\n2️⃣ Creating character and scene 1 setting...")
+    char_image, setting_image, combine_prompt = await asyncio.gather(
+        create_character(client, character),
+        create_setting(client, scenes[0]),
+        make_request(
+            client, "/combine-prompt", {"scene_description": scenes[0]["description"]}
+        ),
+    )
+    progress.flush()
+    if not char_image:
+        return
+
+    # Step 3: Process scenes
+    # Sound effects only feed the final merge, so they run in the background
+    # while the next scene's frame is extracted and its video is generated.
+    # The merge request is opened now and each finished video is streamed into
+    # it, so the server downloads early scenes while later ones are generated.
+    merge_queue = asyncio.Queue()
+    merge_task = asyncio.create_task(stream_merge(client, merge_queue))
+    sound_tasks = []
+    previous_video = None
+
+    for i, scene in enumerate(scenes, 1):
+        # Write out the previous scene's progress in one go
+        progress.flush()
+        logger.info(f"\n3️⃣ Processing Scene {i}/{len(scenes)}")
+
+        if i == 1:
+            # Combine character and setting (only for first scene)
+            if not setting_image:
+                continue
+            if not combine_prompt:
+                logger.error("   ❌ Failed to create combination prompt")
+                continue
+
+            logger.info("   Combining scene...")
+            combined = await make_request(
+                client,
+                "/combine-image",
                 {
-                    "prompt": scene["description"],
-                    "initial_image": initial_image,
+                    "prompt": combine_prompt["prompt"],
+                    "character_image": char_image,
+                    "setting_image": setting_image,
                 },
             )
-            if video:
-                # Add sound effects to the video
-                print(f"   Adding sound effects ({sound_effect})...")
-                video_with_sound = make_request(
-                    "/add-sound-effect",
-                    {"video_url": video["video_url"], "sound_effect": sound_effect},
-                )
-                if video_with_sound:
-                    video_urls.append(video_with_sound["video_url"])
-                    print(f"   ✅ Scene {i} video generated with sound effects")
-                else:
-                    # Fallback to original video if sound effects fail
-                    video_urls.append(video["video_url"])
-                    print(f"   ✅ Scene {i} video generated (sound effects failed)")
+            if not combined:
+                logger.error("   ❌ Failed to combine scene")
+                continue
+            initial_image = combined["image_url"]
+            logger.info("   ✅ Scene combined")
+        else:
+            # For scenes 2+, extract frame from previous video; this is the one
+            # dependency that keeps scenes in order
+            logger.info("   Extracting frame from previous video...")
+            # Sound doesn't change the frames, so use the raw video instead of
+            # waiting for the sound effect version
+            frame = await make_request(
+                client, "/extract-frame", {"video_url": previous_video}
+            )
+            if frame:
+                initial_image = frame["frame_url"]
+                logger.info("   ✅ Frame extracted")
             else:
-                print(f"   ❌ Failed to generate video for scene {i}")
-
-        # Step 4: Merge all videos
-        if video_urls:
-            print(f"\n4️⃣ Merging {len(video_urls)} videos...")
-            merged = make_request("/merge-videos", {"video_urls": video_urls})
-            if merged:
-                print("✅ All videos merged successfully!")
-                print(
-                    f"🎬 Final video: {merged.get('merged_video_path', 'Check response for details')}"
+                logger.error("   ❌ Failed to extract frame, skipping scene")
+                continue
+
+        # Generate video
+        logger.info("   Generating video...")
+        # video_prompt = await make_request(
+        #     client, "/video-prompt", {"scene_description": scene["description"]}
+        # )
+        video = await make_request(
+            client,
+            "/generate-video",
+            {
+                "prompt": scene["description"],
+                "initial_image": initial_image,
+            },
+        )
+        if video:
+            previous_video = video["video_url"]
+            # Add sound effects to the video without blocking the next scene
+            logger.info(
+                f"   ✅ Scene {i} video generated, adding sound effects ({sound_effect}) in background"
+            )
+            sound_tasks.append(
+                asyncio.create_task(
+                    add_sound(
+                        client, i, video["video_url"], sound_effect, merge_queue, len(sound_tasks)
+                    )
                 )
-            else:
-                print("❌ Failed to merge videos")
+            )
+        else:
+            logger.error(f"   ❌ Failed to generate video for scene {i}")
+
+    # Collect the sound effect results in scene order
+    progress.flush()
+    video_urls = list(await asyncio.gather(*sound_tasks))
+    await merge_queue.put(None)  # Every video is queued; end the merge request's body
+
+    # Step 4: Merge all videos
+    if video_urls:
+        logger.info(f"\n4️⃣ Merging {len(video_urls)} videos...")
+        merged = await merge_task
+        if not merged:
+            # The streamed merge failed part-way; send the whole list the regular way
+            merged = await make_request(client, "/merge-videos", {"video_urls": video_urls})
+        if merged:
+            logger.info("✅ All videos merged successfully!")
+            logger.info(
+                f"🎬 Final video: {merged.get('merged_video_path') or merged.get('merged_video_url', 'Check response for details')}"
+            )
+        else:
+            logger.error("❌ Failed to merge videos")
+    else:
+        merge_task.cancel()
+        logger.error("❌ No videos to merge")
+
+
+async def keep_warm(client):
+    """Hold a keep-alive connection open to the API until cancelled."""
+    while True:
+        # Any response will do; it only has to open (or reuse) the connection and
+        # get the server through its first request
+        with contextlib.suppress(httpx.HTTPError):
+            await client.head(API_URL, timeout=CONNECT_TIMEOUT)
+        await asyncio.sleep(WARMUP_INTERVAL)
+
+
+async def ask_idea():
+    """Read the story idea without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    answer = loop.create_future()
+
+    def read():
+        try:
+            idea = input("Enter your story idea: ")
+        except BaseException as e:  # EOF or Ctrl+C while typing
+            loop.call_soon_threadsafe(answer.set_exception, e)
         else:
-            print("❌ No videos to merge")
+            loop.call_soon_threadsafe(answer.set_result, idea)
+
+    # A daemon thread, unlike asyncio.to_thread, never keeps the script alive
+    # waiting for Enter after the workflow has been interrupted
+    threading.Thread(target=read, daemon=True).start()
+    return await answer
+
+
+async def run_with_client():
+    # One client for the whole run so every call reuses pooled keep-alive connections
+    # (pool limits belong to the transport once a custom one is passed)
+    async with httpx.AsyncClient(
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS
+            ),
+            retries=CONNECT_RETRIES,
+        ),
+    ) as client:
+        # The banner has to be on screen before the prompt appears
+        progress.flush()
+
+        # Connect to the API while the user is still typing, so the storyboard
+        # request doesn't pay for the handshake and server warm-up
+        warmup = asyncio.create_task(keep_warm(client))
+        try:
+            # Get idea from user
+            idea = await ask_idea()
+        finally:
+            warmup.cancel()
+
+        if not idea:
+            idea = "A woman sits at her window watching a heavy rainstorm, finding peaceful joy in the cozy warmth of her dry indoor space."
+            logger.info(f"Using default idea: {idea}")
+
+        logger.info(f"\n🚀 Starting workflow with idea: {idea}")
+        logger.info("=" * 40)
+
+        await run(client, idea)
+
 
+def main():
+    logger.setLevel(logging.INFO)
+    logger.addHandler(progress)
+    logger.propagate = False
+
+    logger.info("🎬 AI Reel Maker - Simple Workflow")
+    logger.info("=" * 40)
+
+    try:
+        asyncio.run(run_with_client())
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error(f"❌ Error: {e}")
+    finally:
+        progress.flush()
 
 
 if __name__ == "__main__":
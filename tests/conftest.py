@@ -0,0 +1,47 @@
+"""
+Shared fixtures for the service tests.
+
+Replicate and Redis are replaced in-process, so the tests need neither network
+access nor a running Redis.
+"""
+
+import os
+import sys
+from typing import Any, Dict, List
+
+import pytest
+
+# _replicate refuses to import without a token; the fake client never uses it
+os.environ.setdefault("REPLICATE_API_TOKEN", "test-token")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.services import _cache, _replicate  # noqa: E402
+
+
+@pytest.fixture
+def cache_store(monkeypatch) -> Dict[str, Any]:
+    """Back the Redis cache with a plain dict."""
+    store: Dict[str, Any] = {}
+
+    async def get(key: str) -> Any:
+        return store.get(key)
+
+    async def put(key: str, value: Any, ttl: Any = None) -> None:
+        store[key] = value
+
+    monkeypatch.setattr(_cache, "get", get)
+    monkeypatch.setattr(_cache, "put", put)
+    return store
+
+
+@pytest.fixture
+def replicate_runs(monkeypatch) -> List[Dict[str, Any]]:
+    """Record every client.async_run call and answer each with a distinct URL."""
+    calls: List[Dict[str, Any]] = []
+
+    async def async_run(model: str, input: Dict[str, Any], **kwargs: Any) -> str:
+        calls.append({"model": model, "input": input})
+        return f"https://replicate.delivery/output-{len(calls)}.png"
+
+    monkeypatch.setattr(_replicate.client, "async_run", async_run)
+    return calls
@@ -0,0 +1,27 @@
+import asyncio
+
+from api.services import CharacterImageService, SettingImageService
+
+
+def test_same_prompt_with_different_aspect_ratios_is_cached_separately(
+    cache_store, replicate_runs
+):
+    prompt = "A lighthouse keeper in a yellow raincoat"
+
+    character = asyncio.run(CharacterImageService.create_character_image(prompt))
+    setting = asyncio.run(SettingImageService.create_setting_image(prompt))
+
+    assert [call["input"]["aspect_ratio"] for call in replicate_runs] == ["1:1", "16:9"]
+    assert character["image_url"] != setting["image_url"]
+    assert setting["message"] == "Setting image created successfully"
+    assert len(cache_store) == 2
+
+
+def test_repeated_request_is_served_from_cache(cache_store, replicate_runs):
+    prompt = "A lighthouse keeper in a yellow raincoat"
+
+    first = asyncio.run(SettingImageService.create_setting_image(prompt))
+    second = asyncio.run(SettingImageService.create_setting_image(prompt))
+
+    assert second == first
+    assert len(replicate_runs) == 1
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from api.services import CharacterPromptService
+from api.services import character_prompt_service
+
+
+class _AlwaysSimilar:
+    """Semantic cache whose nearest entry is always the last one added."""
+
+    def __init__(self) -> None:
+        self.entries: List[Dict[str, Any]] = []
+
+    async def lookup(self, text: str) -> Optional[Dict[str, Any]]:
+        return self.entries[-1] if self.entries else None
+
+    async def add(self, text: str, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+
+
+@pytest.fixture
+def gemini_calls(monkeypatch, cache_store) -> List[str]:
+    """Answer every Gemini call by echoing the request, and record the requests."""
+    calls: List[str] = []
+
+    async def stream(model: str, input: Dict[str, Any]):
+        calls.append(input["prompt"])
+        yield f"Full body studio portrait. {input['prompt']} Plain solid black background."
+
+    monkeypatch.setattr(character_prompt_service, "stream", stream)
+    monkeypatch.setattr(character_prompt_service, "_SEMANTIC_CACHE", _AlwaysSimilar())
+    return calls
+
+
+def test_same_traits_under_another_name_reuse_the_expansion(gemini_calls):
+    first = asyncio.run(
+        CharacterPromptService.create_character_prompt(
+            "Maya, a tall woman in her thirties with red hair", "Maya"
+        )
+    )
+    second = asyncio.run(
+        CharacterPromptService.create_character_prompt(
+            "Nora, a tall woman in her  thirties with red hair", "Nora"
+        )
+    )
+
+    assert len(gemini_calls) == 1
+    assert second["prompt"] == first["prompt"].replace("Maya", "Nora")
+
+
+def test_different_traits_are_not_served_from_the_semantic_cache(gemini_calls):
+    asyncio.run(
+        CharacterPromptService.create_character_prompt(
+            "Maya, a tall woman in her thirties with red hair", "Maya"
+        )
+    )
+    second = asyncio.run(
+        CharacterPromptService.create_character_prompt(
+            "Nora, a tall woman in her sixties with grey hair", "Nora"
+        )
+    )
+
+    assert len(gemini_calls) == 2
+    assert "sixties with grey hair" in second["prompt"]
+    assert "red hair" not in second["prompt"]
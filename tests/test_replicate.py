@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+import tenacity
+from replicate.exceptions import ReplicateError
+
+from api.services import _replicate
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_wait(monkeypatch):
+    # Keep the backoff's retry policy but skip its sleeps
+    backoff = _replicate._backoff
+
+    def immediate():
+        retrying = backoff()
+        retrying.wait = tenacity.wait_none()
+        return retrying
+
+    monkeypatch.setattr(_replicate, "_backoff", immediate)
+
+
+def _lazy_stream(monkeypatch, rate_limited_attempts):
+    """Mimic replicate's async_stream: the prediction is created on first iteration."""
+    attempts = []
+
+    async def async_stream(model, input=None, **kwargs):
+        async def events():
+            attempts.append(model)
+            if len(attempts) <= rate_limited_attempts:
+                raise ReplicateError(status=429, detail="Too many requests")
+            for text in ("a", "b", "c"):
+                yield text
+
+        return events()
+
+    monkeypatch.setattr(_replicate.client, "async_stream", async_stream)
+    return attempts
+
+
+async def _collect(model):
+    return "".join([item async for item in _replicate.stream(model, {"prompt": "p"})])
+
+
+def test_stream_retries_a_429_raised_on_first_iteration(monkeypatch):
+    attempts = _lazy_stream(monkeypatch, rate_limited_attempts=2)
+
+    assert asyncio.run(_collect("test/retry-model")) == "abc"
+    assert len(attempts) == 3
+    assert _replicate._semaphore("test/retry-model")._value == _replicate.DEFAULT_CONCURRENCY
+
+
+def test_stream_gives_up_after_the_retry_limit(monkeypatch):
+    _lazy_stream(monkeypatch, rate_limited_attempts=10)
+
+    with pytest.raises(ReplicateError):
+        asyncio.run(_collect("test/limit-model"))
+    assert _replicate._semaphore("test/limit-model")._value == _replicate.DEFAULT_CONCURRENCY